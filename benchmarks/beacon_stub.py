@@ -0,0 +1,163 @@
+"""Stand-in Beacon API serving canned placement search pages, for offline runs.
+
+    python -m benchmarks.beacon_stub serve --records 5000 --port 8765 --latency 0.05
+    beacon_url=http://127.0.0.1:8765 python -c "from utils.update_db import update_responses; update_responses()"
+
+    python -m benchmarks.beacon_stub bench --records 5000 --latency 0.05 --concurrency 1 4 8
+
+Only the two endpoints the app uses are implemented: the token endpoint
+(any credentials get the same token) and Placement/searchwithcount, which pages
+through the synthetic records newest modifiedOn first. --latency adds a delay to
+every search response to stand in for the network round trip and Beacon's own
+query time. bench fetches every page with BeaconClient at each concurrency and
+reports the time taken and how many TCP connections the server saw.
+"""
+
+import argparse
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+from benchmarks.synthetic import generate_records
+
+TOKEN = "Bearer beacon-stub"
+
+
+def placement_records(n: int, seed: int = 0) -> list[dict[str, Any]]:
+    """Search results for the synthetic students, newest modifiedOn first."""
+    modified = datetime(2025, 6, 1, tzinfo=timezone.utc)
+    records = []
+    for i, student in enumerate(generate_records(n, seed)):
+        records.append(
+            {
+                "applicationId": student["applicationid"],
+                "participantId": student["participantid"],
+                "firstName": student["namefirst"],
+                "residenceCountry": student["residenceCountry"],
+                "productName": student["program_type"],
+                "age": student["adjusted_age"],
+                # uppercase, like the real export
+                "placementStatusName": student["placementStatusName"],
+                "modifiedOn": (modified - timedelta(minutes=7 * i)).isoformat(),
+            }
+        )
+    return records
+
+
+class BeaconStub(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], records: list[dict[str, Any]], latency: float) -> None:
+        super().__init__(address, _Handler)
+        self.records: list[dict[str, Any]] = records
+        self.latency: float = latency
+        self.connections: int = 0
+        self.searches: int = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, what: str) -> None:
+        with self._lock:
+            setattr(self, what, getattr(self, what) + 1)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # keep-alive, so a pooled client reuses its connections
+    protocol_version = "HTTP/1.1"
+    # headers and body go out as separate writes, Nagle would hold the body back
+    disable_nagle_algorithm = True
+    server: BeaconStub
+
+    def setup(self) -> None:
+        super().setup()
+        self.server.count("connections")
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _send(self, status: int, body: Any) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path == "/authorization/token":
+            self._send(200, {"access_token": TOKEN.removeprefix("Bearer ")})
+            return
+        if self.path != "/Placement/searchwithcount":
+            self._send(404, {"message": "Not found"})
+            return
+        if self.headers.get("Authorization") != TOKEN:
+            self._send(401, {"message": "Authorization has been denied for this request."})
+            return
+
+        query = json.loads(body)
+        page, page_size = int(query.get("page", 1)), int(query.get("pageSize", 100))
+        self.server.count("searches")
+        time.sleep(self.server.latency)
+        records = self.server.records
+        start = (page - 1) * page_size
+        self._send(200, {"count": len(records), "results": records[start : start + page_size]})
+
+
+def serve(records: list[dict[str, Any]], port: int = 0, latency: float = 0.0) -> BeaconStub:
+    """Start a stub on a background thread, port 0 picks a free one (see .url)."""
+    server = BeaconStub(("127.0.0.1", port), records, latency)
+    threading.Thread(target=server.serve_forever, name="beacon-stub", daemon=True).start()
+    return server
+
+
+def bench(records: int, latency: float, page_size: int, concurrencies: list[int]) -> None:
+    from utils.beacon_client import BeaconClient
+    from utils.update_db import PLACEMENT_QUERY
+
+    expected = placement_records(records)
+    for concurrency in concurrencies:
+        server = serve(expected, latency=latency)
+        client = BeaconClient(server.url, concurrency=concurrency, page_size=page_size)
+        client.token = TOKEN
+        started = time.perf_counter()
+        with client:
+            fetched = [r for page in client.iter_pages(PLACEMENT_QUERY) for r in page["results"]]
+        elapsed = time.perf_counter() - started
+        server.shutdown()
+        server.server_close()
+        assert fetched == expected, "pages came back out of order or incomplete"
+        print(
+            f"concurrency {concurrency:>2}: {server.searches} pages in {elapsed:.2f}s "
+            f"over {server.connections} connections"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("mode", choices=("serve", "bench"))
+    parser.add_argument("--records", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    args = parser.parse_args()
+
+    if args.mode == "bench":
+        bench(args.records, args.latency, args.page_size, args.concurrency)
+        return
+    server = BeaconStub(("127.0.0.1", args.port), placement_records(args.records, args.seed), args.latency)
+    print(f"Serving {len(server.records)} placements on {server.url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
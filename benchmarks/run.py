@@ -0,0 +1,245 @@
+"""Search benchmarks over synthetic corpora.
+
+    python -m benchmarks.run --sizes 1000 10000 100000
+    python -m benchmarks.run --sizes 10000 --baseline benchmarks/results/abc1234.json
+
+Every corpus size runs in its own subprocess inside a scratch directory, so the
+import time corpus load (and its user_auth.db) starts cold and never touches
+the real data. Results are written as JSON, by default to
+benchmarks/results/<commit>.json, so runs can be compared between commits.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+# name -> SearchFilters kwargs
+FILTER_MATRIX: dict[str, dict[str, Any]] = {
+    "structured": {
+        "statusOptions": ("Allocated", "Unassigned"),
+        "gender_female": True,
+        "gender_male": False,
+        "country_of_origin": "germany",
+        "gpa": "3.0",
+    },
+    "structured_broad": {"statusOptions": ("All",), "adjusted_age": "15"},
+    "free_text": {"free_text": "guitar"},
+    "free_text_long": {"free_text": "excited to learn american culture"},
+    "photo_search": {"photo_search": "beach with my family"},
+    "combined": {
+        "statusOptions": ("Allocated",),
+        "program_types": ("10-month-aug", "5-month-aug"),
+        "free_text": "soccer",
+        "photo_search": "friends",
+    },
+}
+
+
+def _rss_mb() -> float:
+    # ru_maxrss is KiB on linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def _timed(
+    fn: Callable[[], Any], repeat: int, between: Optional[Callable[[], Any]] = None
+) -> dict[str, float]:
+    """Timings of `repeat` calls of fn, with `between` run untimed before each one."""
+    runs = []
+    for _ in range(repeat):
+        if between is not None:
+            between()
+        started = time.perf_counter()
+        fn()
+        runs.append((time.perf_counter() - started) * 1000)
+    return {"min_ms": min(runs), "median_ms": statistics.median(runs), "max_ms": max(runs)}
+
+
+def run_worker(repeat: int) -> dict[str, Any]:
+    """Benchmarks for the corpus named by $student_data_path, from the current directory."""
+    quiet = contextlib.redirect_stdout(io.StringIO())
+
+    rss_before = _rss_mb()
+    started = time.perf_counter()
+    with quiet:
+        from routers import students
+    load_s = time.perf_counter() - started
+    rss_after_load = _rss_mb()
+
+    from models.search_filters import SearchFilters
+    from utils.search_filters import matching_positions
+
+    result: dict[str, Any] = {
+        "students": len(students.CORPUS.current.students),
+        "corpus_load_s": load_s,
+        "rss_before_mb": rss_before,
+        "rss_after_load_mb": rss_after_load,
+        "filter_students": {},
+        "search_endpoint": {},
+    }
+
+    for name, kwargs in FILTER_MATRIX.items():
+        filters = SearchFilters(**kwargs)
+        with contextlib.redirect_stdout(io.StringIO()):
+            matches = len(matching_positions(students.CORPUS.current.index, filters))
+            timings = _timed(lambda: matching_positions(students.CORPUS.current.index, filters), repeat)
+        result["filter_students"][name] = {"matches": matches, **timings}
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        import main
+    result["app_import_s"] = time.perf_counter() - started
+    result["rss_after_app_mb"] = _rss_mb()
+
+    from fastapi.testclient import TestClient
+
+    from routers.auth import get_current_user
+
+    main.app.dependency_overrides[get_current_user] = lambda: {"id": "bench", "favorites": "[]"}
+    client = TestClient(main.app)
+
+    def settle() -> None:
+        # a first page leaves the full search running in the background, which
+        # would otherwise compete with (and fill the cache for) the next request
+        with students._full_searches_lock:
+            pending = list(students._full_searches.values())
+        for future in pending:
+            future.result()
+        students.FILTER_CACHE.clear()
+
+    for name, kwargs in FILTER_MATRIX.items():
+        body = json.loads(SearchFilters(**kwargs).model_dump_json(exclude_none=True))
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            cold_timings = _timed(
+                lambda: client.post("/students/search", json=body), repeat, between=settle
+            )
+            settle()
+            # fills the cache with the full result, so the warm run is a cache hit
+            client.post("/students/search", json=body, params={"page": 2})
+            warm_timings = _timed(lambda: client.post("/students/search", json=body), repeat)
+        result["search_endpoint"][name] = {"cold": cold_timings, "warm": warm_timings}
+
+    return result
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _flatten(value: Any, prefix: str = "") -> dict[str, float]:
+    if isinstance(value, dict):
+        flat: dict[str, float] = {}
+        for k, v in value.items():
+            flat.update(_flatten(v, f"{prefix}.{k}" if prefix else str(k)))
+        return flat
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return {prefix: float(value)}
+    return {}
+
+
+def compare(baseline: dict[str, Any], current: dict[str, Any]) -> None:
+    old = _flatten(baseline["results"])
+    new = _flatten(current["results"])
+    print(f"\n{'metric':<70} {'baseline':>12} {'current':>12} {'change':>8}")
+    for key in sorted(old.keys() & new.keys()):
+        if not (key.endswith("_ms") or key.endswith("_s") or key.endswith("_mb")):
+            continue
+        change = (new[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+        print(f"{key:<70} {old[key]:>12.3f} {new[key]:>12.3f} {change:>+7.1f}%")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=None)
+    parser.add_argument("--baseline", type=Path, default=None)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--worker-output", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        with open(args.worker_output, "w") as f:
+            json.dump(run_worker(args.repeat), f)
+        return
+
+    from benchmarks.synthetic import write_records
+
+    commit = _git_commit()
+    report: dict[str, Any] = {
+        "commit": commit,
+        "timestamp": datetime.now(tz=timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "results": {},
+    }
+
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory(prefix=f"bench_{size}_") as scratch:
+            data_path = Path(scratch) / "data" / "student_extra_info.json"
+            data_path.parent.mkdir()
+            started = time.perf_counter()
+            write_records(size, str(data_path), seed=args.seed)
+            print(f"[{size}] generated corpus in {time.perf_counter() - started:.1f}s")
+
+            worker_output = Path(scratch) / "result.json"
+            env = {
+                **os.environ,
+                "student_data_path": str(data_path),
+                "PYTHONPATH": os.pathsep.join(
+                    p for p in (str(REPO_ROOT), os.environ.get("PYTHONPATH")) if p
+                ),
+            }
+            subprocess.run(
+                [
+                    sys.executable, "-m", "benchmarks.run", "--worker",
+                    "--repeat", str(args.repeat), "--worker-output", str(worker_output),
+                ],
+                cwd=scratch,
+                env=env,
+                check=True,
+            )
+            with open(worker_output) as f:
+                report["results"][str(size)] = json.load(f)
+            print(f"[{size}] {json.dumps(report['results'][str(size)], indent=2)}")
+
+    output = args.output or RESULTS_DIR / f"{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"wrote {output}")
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
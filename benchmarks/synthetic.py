@@ -0,0 +1,137 @@
+"""Synthetic student records shaped like the Beacon export in data/student_extra_info.json.
+
+    python -m benchmarks.synthetic 10000 /tmp/students_10k.json
+"""
+
+import random
+import sys
+from typing import Any, Iterator
+
+from utils.json_stream import JSONArrayWriter
+
+STATUSES = [
+    ("ALLOCATED", 30),
+    ("UNASSIGNED", 15),
+    ("PLACEMENT PENDING", 10),
+    ("PLACEMENT - REVIEW NEEDED", 5),
+    ("PLACED", 15),
+    ("PLACED - ACCEPTED", 15),
+    ("PLACED - CLOSED", 5),
+    ("PLACED - UPDATED", 5),
+]
+
+COUNTRIES = [
+    ("Germany", 18), ("Italy", 12), ("Spain", 10), ("Brazil", 8), ("Japan", 6),
+    ("Korea, Republic of", 5), ("France", 5), ("Thailand", 5), ("Denmark", 4),
+    ("Norway", 4), ("Vietnam", 4), ("Mexico", 3), ("China", 3), ("Indonesia", 3),
+    ("Pakistan", 2), ("Ukraine", 2), ("Georgia", 2), ("Morocco", 2), ("Chile", 2),
+]
+
+STATES = [
+    "AL", "AZ", "CA", "CO", "CT", "FL", "GA", "IA", "ID", "IL", "IN", "KS", "KY",
+    "LA", "MA", "MD", "MI", "MN", "MO", "NC", "NE", "NH", "NJ", "NY", "OH", "OK",
+    "OR", "PA", "SC", "TN", "TX", "UT", "VA", "WA", "WI",
+]
+
+PROGRAMS = [
+    "High School USA August 10 Month Exchange",
+    "High School USA August 5 Month Exchange",
+    "2026 High School USA January 10 Month Exchange",
+    "2026 High School USA January 5 Month Exchange",
+]
+
+ID_PREFIXES = [
+    ("ABC", 20), ("DEF", 20), ("GHI", 15), ("JKL", 10), ("FLX", 8),
+    ("YES", 8), ("CBE", 6), ("CBX", 5), ("FAO", 4), ("CBG", 4),
+]
+
+INTERESTS = [
+    "Soccer", "Basketball", "Volleyball", "Swimming", "Tennis", "Dance", "Music",
+    "Piano", "Guitar", "Singing", "Drawing", "Painting", "Photography", "Reading",
+    "Cooking", "Hiking", "Camping", "Theater", "Video Games", "Running", "Yoga",
+]
+
+FIRST_NAMES = [
+    "Anna", "Luca", "Marie", "Kenji", "Sofia", "Paulo", "Yuna", "Jonas", "Emma",
+    "Mateo", "Lea", "Minh", "Giulia", "Ahmed", "Ingrid", "Haruto", "Camila", "Oskar",
+]
+
+RELIGIONS = ["Catholic", "Protestant", "Buddhist", "Muslim", "Orthodox", "None", "Other"]
+
+WORDS = (
+    "i love to play with my friends family dog cat school weekend summer winter "
+    "travel beach mountains city music sport team coach practice game learn english "
+    "american culture host brother sister parents grandmother cooking dinner movies "
+    "books science math history art guitar piano football soccer basketball swim "
+    "volunteer church community excited experience new life adventure year abroad "
+    "kind friendly open minded curious responsible helpful shy funny honest"
+).split()
+
+
+def _weighted(rng: random.Random, options: list[tuple[str, int]]) -> str:
+    return rng.choices([o for o, _ in options], weights=[w for _, w in options])[0]
+
+
+def _sentence(rng: random.Random, low: int, high: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(low, high))).capitalize()
+
+
+def _text(rng: random.Random, sentences: int) -> str:
+    return ". ".join(_sentence(rng, 6, 18) for _ in range(sentences)) + "."
+
+
+def generate_records(n: int, seed: int = 0) -> Iterator[dict[str, Any]]:
+    rng = random.Random(seed)
+    for i in range(n):
+        prefix = _weighted(rng, ID_PREFIXES)
+        yield {
+            "namefirst": rng.choice(FIRST_NAMES),
+            "applicationid": 100000 + i,
+            "participantid": 500000 + i,
+            "residenceCountry": _weighted(rng, COUNTRIES),
+            "schoolInfoGPA": rng.choice(["", f"{rng.uniform(2.0, 4.0):.2f}"]),
+            "englishTestScore": str(rng.randint(40, 100)),
+            "gradeApplyingTo": rng.randint(9, 12),
+            "usahsId": f"{prefix}{'EP' if rng.random() < 0.15 else ''}{rng.randint(10000, 99999)}",
+            "program_type": rng.choice(PROGRAMS),
+            "adjusted_age": rng.choice([0, 15, 15, 16, 16, 16, 17, 17, 18]),
+            "genderdescription": rng.choice(["Female", "Male"]),
+            "student_id": 900000 + i,
+            "currentGradeLevel": rng.randint(8, 11),
+            "statussystemname": "Canceled" if rng.random() < 0.03 else "Active",
+            "states": rng.sample(STATES, rng.choice([0, 0, 1, 2, 3])),
+            "early_placement": rng.random() < 0.1,
+            "urban": rng.choice(["Urban", "Suburban", "Rural", ""]),
+            "single_placement": rng.random() < 0.6,
+            "double_placement": rng.random() < 0.4,
+            "interests": {
+                "free_text": [_sentence(rng, 2, 6) for _ in range(rng.randint(1, 4))],
+                "family_description": _text(rng, rng.randint(2, 6)),
+                "favorite_subject": rng.choice(["Math", "Biology", "History", "Art", "English"]),
+                "selectables": rng.sample(INTERESTS, rng.randint(2, 8)),
+            },
+            "photo_comments": _text(rng, rng.randint(1, 8)),
+            "religion": rng.choice(RELIGIONS),
+            "allergies_comment": rng.choice(["", "", "", "Peanuts", "Cats", "Pollen and dust"]),
+            "diet_comment": rng.choice(["", "", "Vegetarian", "No pork", "Lactose intolerant"]),
+            "religiousFrequency": rng.choice([0, 0, 1, 2]),
+            "messages": [
+                _text(rng, rng.randint(5, 20)),
+                _text(rng, rng.randint(3, 12)),
+                _text(rng, rng.randint(3, 12)),
+            ],
+            "media_link": rng.choice(["", "", f"https://video.example.com/{i}"]),
+            "health_comments": [rng.choice(["", "Asthma", "None", "Wears glasses"])],
+            "can_live_w_pets": rng.choice([True, True, False, None]),
+            "placementStatusName": _weighted(rng, STATUSES),
+        }
+
+
+def write_records(n: int, path: str, seed: int = 0) -> None:
+    with open(path, "w") as f, JSONArrayWriter(f) as writer:
+        for record in generate_records(n, seed):
+            writer.write(record)
+
+
+if __name__ == "__main__":
+    write_records(int(sys.argv[1]), sys.argv[2])
@@ -1,8 +1,12 @@
+import time
+
 from routers.auth import get_current_user
-from fastapi import Depends, FastAPI
+from fastapi import Depends, FastAPI, Request
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 
-from routers import misc, students, auth, users  # embeddings
+from routers import misc, students, auth, users, embeddings
+from utils.metrics import REQUEST_SECONDS, render_metrics
 
 app = FastAPI()
 
@@ -24,3 +28,26 @@ app.include_router(auth.router)
 app.include_router(students.router, dependencies=[Depends(get_current_user)])
 app.include_router(misc.router, dependencies=[Depends(get_current_user)])
 app.include_router(users.router, dependencies=[Depends(get_current_user)])
+app.include_router(embeddings.router, dependencies=[Depends(get_current_user)])
+
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    # route template rather than the raw path, so ids do not explode the label set
+    route = request.scope.get("route")
+    REQUEST_SECONDS.observe(
+        time.perf_counter() - started,
+        method=request.method,
+        route=getattr(route, "path", "unmatched"),
+        status=str(response.status_code),
+    )
+    return response
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics() -> PlainTextResponse:
+    # unauthenticated for the scraper, which reaches uvicorn directly; nginx.conf
+    # refuses /api/metrics so it is never served to the outside
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -23,3 +23,16 @@ class SearchFilters(BaseModel, frozen=True):
     early_placement: Optional[str] = None  # done
     hasVideo: Optional[bool] = None  # done
     statusOptions: Optional[Tuple[str, ...]] = None  # done
+    # inclusive numeric ranges, either end may be left open
+    gpa_min: Optional[float] = None
+    gpa_max: Optional[float] = None
+    adjusted_age_min: Optional[int] = None
+    adjusted_age_max: Optional[int] = None
+    applying_to_grade_min: Optional[int] = None
+    applying_to_grade_max: Optional[int] = None
+    current_grade_min: Optional[int] = None
+    current_grade_max: Optional[int] = None
+    english_score_min: Optional[float] = None
+    english_score_max: Optional[float] = None
+    religious_frequency_min: Optional[int] = None
+    religious_frequency_max: Optional[int] = None
@@ -1,15 +1,35 @@
-import json
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from enum import Enum
-from functools import lru_cache
 from pathlib import Path
+from typing import Literal, Optional, Union
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from pydantic import BaseModel
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from pydantic import BaseModel, Field, model_validator
 
 from models.search_filters import SearchFilters
 from models.student import BasicStudent, FullStudent
 from utils import db
-from utils.search_filters import filter_students
+from utils.corpus import (
+    Corpus,
+    CorpusHolder,
+    prepare_in_subprocess,
+    source_signature,
+    vectors_directory,
+)
+from utils.corpus_snapshot import load_students
+from utils.embeddings import VectorIndex
+from utils.facets import facet_counts
+from utils.filter_cache import FilterCache, filter_key
+from utils.metrics import Gauge
+from utils.payloads import RawJSON, RawJSONResponse, StudentPayloads
+from utils.query_planner import QueryPlan
+from utils.search_cursor import StaleCursorError, cursor_after, resume_rank
+from utils.search_filters import first_matches, has_text_filters, matching_positions
+from utils.student_fields import parse_students
+from utils.student_index import StudentIndex, iter_bits
 
 router: APIRouter = APIRouter(prefix="/students", tags=["students"])
 
@@ -28,160 +48,295 @@ class ItemQueryParams(BaseModel):
     descending: bool = True
 
 
-def _full_student_dict(student: dict) -> FullStudent:
-    # helper func to avoid having to retype this entire section each time
-    return FullStudent(
-        first_name=student["namefirst"],
-        app_id=student["applicationid"],
-        pax_id=student["participantid"],
-        country=student["residenceCountry"],
-        gpa=student["schoolInfoGPA"],
-        english_score=student["englishTestScore"],
-        applying_to_grade=student["gradeApplyingTo"],
-        usahsid=student["usahsId"],
-        program_type=student["program_type"]
-        .replace("High School USA ", "")
-        .replace("Exchange", "")
-        .replace("2026 ", "")
-        .strip(),
-        adjusted_age=student["adjusted_age"],
-        gender_desc=student["genderdescription"],
-        id=student["student_id"],
-        current_grade=student["currentGradeLevel"],
-        status=student["statussystemname"],
-        states=student["states"],
-        early_placement=student["early_placement"],
-        urban_request=student["urban"],
-        single_placement=student["single_placement"],
-        double_placement=student["double_placement"],
-        free_text_interests=student["interests"]["free_text"],
-        family_description=student["interests"]["family_description"],
-        favorite_subjects=student["interests"]["favorite_subject"],
-        selected_interests=student["interests"]["selectables"],
-        photo_comments=student["photo_comments"],
-        religion=student["religion"],
-        allergy_comments=student["allergies_comment"],
-        dietary_restrictions=student["diet_comment"],
-        religious_frequency=student["religiousFrequency"],
-        intro_message=student["messages"][0],
-        message_to_host_family=student["messages"][1],
-        message_from_natural_family=student["messages"][2],
-        media_link=student.get("media_link", ""),
-        health_comments=student["health_comments"],
-        live_with_pets=student["can_live_w_pets"],
-        placement_status=student["placementStatusName"].title(),
+BATCH_LIMIT = 500
+
+
+class StudentBatch(BaseModel):
+    # exactly one of the two
+    app_ids: Optional[list[int]] = Field(default=None, max_length=BATCH_LIMIT)
+    pax_ids: Optional[list[int]] = Field(default=None, max_length=BATCH_LIMIT)
+    # "basic", "full" or a list of FullStudent fields
+    fields: Union[Literal["basic", "full"], list[str]] = "basic"
+    # None keeps the order of the ids
+    order_by: Optional[OrderBy] = None
+    descending: bool = False
+
+    @model_validator(mode="after")
+    def _check(self) -> "StudentBatch":
+        if (self.app_ids is None) == (self.pax_ids is None):
+            raise ValueError("Pass either app_ids or pax_ids")
+        if isinstance(self.fields, list):
+            unknown = set(self.fields) - set(FullStudent.model_fields)
+            if unknown:
+                raise ValueError(f"Unknown fields: {sorted(unknown)}")
+        return self
+
+
+DATA_PATH = Path(
+    os.getenv(
+        "student_data_path",
+        Path(__file__).resolve().parent.parent / "data" / "student_extra_info.json",
     )
+)
 
 
-DATA_PATH = Path(__file__).resolve().parent.parent / "data" / "student_extra_info.json"
-with open(DATA_PATH) as f:
-    student_data = json.load(f)
-    STUDENTS: list[FullStudent] = [
-        _full_student_dict(s)
-        for s in student_data
-        if s.get("namefirst").lower() != "test"
-        and s.get("statussystemname").lower() != "canceled"
-    ]
-    PLACED_STUDENTS: list[FullStudent] = [
-        x
-        for x in STUDENTS
-        if x.placement_status.lower() != "allocated"
-        and x.placement_status.lower() != "unassigned"
-    ]
-    PLACEABLE_STUDENTS: list[FullStudent] = [
-        x
-        for x in STUDENTS
-        if x.placement_status.lower() == "allocated"
-        or x.placement_status.lower() == "unassigned"
-    ]
-
-_existing_students = db.read_students()
-
-for student in STUDENTS:
-    if student.app_id not in _existing_students:
-        db.add_student(
-            first_name=student.first_name,
-            app_id=student.app_id,
-            pax_id=student.pax_id,
-            country=student.country,
-            program_type=student.program_type,
-            adjusted_age=student.adjusted_age,
-            placement_status=student.placement_status,
+def _build_corpus(path: Path) -> Corpus:
+    signature = source_signature(path)
+    # read from the binary snapshot when it is up to date with the JSON (see
+    # utils.corpus_snapshot) and kept as columns, pydantic models are only built
+    # for the responses that need them
+    students = load_students(path, parse_students)
+    index = StudentIndex(students)
+    placeable_positions = list(
+        iter_bits(
+            index.placement_status.get("allocated", 0)
+            | index.placement_status.get("unassigned", 0)
         )
-    else:
-        try:
-            db.update_student_status(
-                app_id=student.app_id, placement_status=student.placement_status
-            )
-        except Exception as e:
-            print(e)
+    )
+    corpus = Corpus(
+        students=students,
+        index=index,
+        payloads=StudentPayloads(students),
+        placeable_positions=placeable_positions,
+        vectors=VectorIndex.load_or_build(students=students, directory=vectors_directory(path)),
+        source_signature=signature,
+    )
+    db.sync_students(students)
+    return corpus
 
-current_s_ids = {s.app_id for s in STUDENTS}
-for student in _existing_students:
-    if student not in current_s_ids:
-        db.delete_student(student)
+
+# request handlers read CORPUS.current once and use that corpus throughout, so a
+# reload swapping in a new one never mixes two versions within a request.
+# Reloads parse and derive in a subprocess, see utils.corpus
+CORPUS = CorpusHolder(DATA_PATH, _build_corpus, prepare=prepare_in_subprocess)
+RELOAD_INTERVAL: float = float(os.getenv("student_reload_interval", "30"))
+if RELOAD_INTERVAL > 0:
+    CORPUS.watch(RELOAD_INTERVAL)
 
 
 @router.get(path="/")
 def list_students():
-    return {"First Student": PLACEABLE_STUDENTS[0:10]}
+    corpus = CORPUS.current
+    return {"First Student": [corpus.students.model(i) for i in corpus.placeable_positions[0:10]]}
 
 
 @router.get(path="/basic/{app_id}", response_model=BasicStudent)
-def get_basic_student(app_id: int) -> BasicStudent:
-    for student in STUDENTS:
-        if student.app_id == app_id:
-            return BasicStudent(**student.model_dump())
-    raise HTTPException(status_code=404, detail="Student not found")
+def get_basic_student(app_id: int) -> Response:
+    corpus = CORPUS.current
+    i = corpus.index.lookup("app_id", app_id)
+    if i is None:
+        raise HTTPException(status_code=404, detail="Student not found")
+    return RawJSONResponse(corpus.payloads.basic[i])
 
 
 @router.get(path="/full/{app_id}", response_model=FullStudent)
-def get_full_student(app_id: int) -> FullStudent:
-    ...
-    for student in STUDENTS:
-        if student.app_id == app_id:
-            return student
-    raise HTTPException(status_code=404, detail="Student not found")
+def get_full_student(app_id: int) -> Response:
+    corpus = CORPUS.current
+    i = corpus.index.lookup("app_id", app_id)
+    if i is None:
+        raise HTTPException(status_code=404, detail="Student not found")
+    return RawJSONResponse(corpus.payloads.full[i])
+
 
+@router.post(path="/batch")
+def get_student_batch(batch: StudentBatch) -> Response:
+    """Several students in one round trip, for comparison views and favorites.
 
-@lru_cache(maxsize=128)
-def apply_filters(filters: SearchFilters) -> list[FullStudent]:
-    return filter_students(students=STUDENTS, filters=filters)
+    Ids that aren't in the corpus are listed under "missing", duplicates are
+    returned once.
+    """
+    corpus = CORPUS.current
+    if batch.app_ids is not None:
+        key, ids = "app_id", batch.app_ids
+    elif batch.pax_ids is not None:
+        key, ids = "pax_id", batch.pax_ids
+    else:
+        # StudentBatch._check already rejects this
+        raise HTTPException(status_code=422, detail="Pass either app_ids or pax_ids")
+    positions: list[int] = []
+    seen: set[int] = set()
+    missing: list[int] = []
+    for value, i in zip(ids, corpus.index.lookup_many(key, ids)):
+        if i is None:
+            missing.append(value)
+        elif i not in seen:
+            seen.add(i)
+            positions.append(i)
+
+    if batch.order_by is not None:
+        rank = corpus.index.rank[(batch.order_by.value, batch.descending)]
+        positions.sort(key=rank.__getitem__)
+
+    if batch.fields == "basic":
+        results: list = [corpus.payloads.basic[i] for i in positions]
+    elif batch.fields == "full":
+        results = [corpus.payloads.full[i] for i in positions]
+    else:
+        include = set(batch.fields)
+        results = [
+            corpus.students.model(i).model_dump(mode="json", include=include) for i in positions
+        ]
+    return RawJSONResponse({"results": results, "missing": missing})
+
+
+FILTER_CACHE = FilterCache()
+Gauge("filter_cache_bytes", "Bytes held by the filter result cache.", lambda: FILTER_CACHE.bytes)
+
+
+def apply_filters(index: StudentIndex, filters: SearchFilters) -> np.ndarray:
+    return FILTER_CACHE.get_or_compute(
+        index,
+        filters,
+        lambda: matching_positions(index=index, filters=filters),
+    )
+
+
+def _compute_filters(index: StudentIndex, filters: SearchFilters) -> np.ndarray:
+    """apply_filters for callers that already missed FILTER_CACHE.get, so each
+    request is counted once in the cache stats."""
+    positions = FILTER_CACHE.peek(index, filters)
+    if positions is None:
+        positions = FILTER_CACHE.put(
+            index, filters, matching_positions(index=index, filters=filters)
+        )
+    return positions
+
+
+# Full fuzzy searches keep running here after the first page has been returned.
+# Only in flight searches are tracked, finished results live in FILTER_CACHE
+_BACKGROUND_SEARCHES = ThreadPoolExecutor(max_workers=2)
+_full_searches: dict[tuple, Future] = {}
+_full_searches_lock = threading.RLock()
+
+
+def _full_search(index: StudentIndex, filters: SearchFilters) -> Future:
+    key = (index.generation, filter_key(filters))
+    with _full_searches_lock:
+        future = _full_searches.get(key)
+        if future is None:
+            future = _BACKGROUND_SEARCHES.submit(_compute_filters, index, filters)
+            _full_searches[key] = future
+            future.add_done_callback(lambda _: _forget_search(key))
+        return future
+
+
+def _forget_search(key: tuple) -> None:
+    with _full_searches_lock:
+        _full_searches.pop(key, None)
 
 
 @router.post(path="/search")
 def search(
     filters: SearchFilters,
-    page: int = Query(default=1, ge=1),
+    page: Optional[int] = Query(default=1, ge=1),
     page_size: int = Query(default=21, ge=1, le=100),
     params: ItemQueryParams = Depends(),
+    explain: bool = Query(default=False),
+    cursor: Optional[str] = Query(default=None),
 ):
-    print(filters)
-
-    results: list[FullStudent] = apply_filters(filters)  # pyright: ignore[reportRedeclaration, reportAssignmentType]
+    corpus = CORPUS.current
+    index = corpus.index
+    order_by: str = params.order_by.value
+    descending: bool = params.descending
+    # with a cursor (the next_cursor of a previous response) `page` is ignored and
+    # the page starts right after the last row the cursor saw
+    after: int = -1
+    if cursor is not None:
+        try:
+            after = resume_rank(index, filters, cursor, order_by, descending)
+        except StaleCursorError as e:
+            raise HTTPException(status_code=410, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        page = None
 
-    results: list[FullStudent] = sorted(  # pyright: ignore[reportRedeclaration]
-        results,
-        key=lambda x: x.__getattribute__(params.order_by),
-        reverse=params.descending,
-    )
+    start: int = 0 if page is None else (page - 1) * page_size
+    end: int = start + page_size
+    complete: bool = True
 
-    results: list[BasicStudent] = [BasicStudent(**x.model_dump()) for x in results]
+    positions: Optional[np.ndarray] = FILTER_CACHE.get(index, filters)
+    future: Optional[Future] = None
+    if positions is None and has_text_filters(filters):
+        future = _full_search(index, filters)
+    if future is not None and not future.done():
+        # only score as many candidates as it takes to fill this page, the full
+        # search finishes in the background for the total and later pages
+        ordered, complete = first_matches(
+            index=index,
+            filters=filters,
+            order_by=order_by,
+            descending=descending,
+            limit=end,
+            after=after,
+        )
+        rows = ordered[start:end]
+        has_more: bool = not complete or len(ordered) > end
+        # only a lower bound until the search is complete, and only counts what
+        # comes after the cursor, so unknown in either case
+        total: Optional[int] = len(ordered) if complete and cursor is None else None
+    else:
+        if positions is None:
+            positions = future.result() if future is not None else _compute_filters(index, filters)
+        # the result sorted on this order key, as ranks into the presorted order,
+        # so any page (cursor or deep offset) is a slice rather than a re-sort
+        ranks: np.ndarray = FILTER_CACHE.get_or_compute(
+            index,
+            filters,
+            lambda: index.sorted_ranks(positions, order_by, descending),
+            variant=(order_by, descending),
+        )
+        total = len(ranks)
+        if cursor is not None:
+            start = int(np.searchsorted(ranks, after, side="right"))
+            end = start + page_size
+            page = start // page_size + 1
+        rows = index.order[(order_by, descending)][ranks[start:end]]
+        has_more = end < total
 
-    total: int = len(results)
-    start: int = (page - 1) * page_size
-    end: int = start + page_size
-    paginated: list[BasicStudent] = results[start:end]
+    paginated: list[RawJSON] = [corpus.payloads.basic[i] for i in rows]
 
-    return {
+    response = {
         "page": page,
         "page_size": page_size,
         "total_results": total,
-        "total_pages": (total + page_size - 1) // page_size,
+        "total_pages": None if total is None else (total + page_size - 1) // page_size,
+        "complete": complete,
         "results": paginated,
+        "next_cursor": (
+            cursor_after(index, filters, order_by, descending, int(rows[-1]))
+            if has_more and len(rows)
+            else None
+        ),
     }
+    if explain:
+        # debug only: runs the whole plan again uncached to time every step
+        plan = QueryPlan(index, filters)
+        plan.execute()
+        response["plan"] = plan.explain()
+    return RawJSONResponse(response)
+
+
+@router.post(path="/facets")
+def facets(filters: SearchFilters):
+    return facet_counts(index=CORPUS.current.index, filters=filters)
 
 
 @router.get(path="/update_db")
-def update_student_db() -> None:
-    apply_filters.cache_clear()
+def update_student_db(wait: bool = Query(default=False)):
+    """Reload the student data in the background, or wait for it with ?wait=true.
+
+    Requests keep being served from the current corpus until the new one is
+    swapped in, and cached results of the old one are dropped with it.
+    """
+    future = CORPUS.reload()
+    if wait:
+        try:
+            future.result()
+        except Exception:
+            raise HTTPException(status_code=500, detail=CORPUS.last_error)
+    return CORPUS.status()
+
+
+@router.get(path="/cache_stats")
+def get_cache_stats():
+    return FILTER_CACHE.stats()
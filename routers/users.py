@@ -1,8 +1,9 @@
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, Query, Response
 from models.student import BasicStudent
-from routers.students import STUDENTS
+from routers.students import CORPUS
 from routers.auth import get_current_user
 from utils import db
+from utils.payloads import RawJSONResponse
 import json
 
 router: APIRouter = APIRouter(prefix="/user", tags=["user"])
@@ -15,8 +16,8 @@ def get_user(current_user=Depends(get_current_user)):
     return user
 
 
-@router.get(path="/favorites")
-def get_user_favorites(current_user=Depends(dependency=get_current_user)) -> list[BasicStudent]:
+@router.get(path="/favorites", response_model=list[BasicStudent])
+def get_user_favorites(current_user=Depends(dependency=get_current_user)) -> Response:
     """Return the favorites list for the current user."""
     favorites = []
     if current_user["favorites"]:
@@ -26,11 +27,12 @@ def get_user_favorites(current_user=Depends(dependency=get_current_user)) -> lis
             pass
 
     print(favorites)
-    return [
-        BasicStudent(**student.model_dump())
-        for student in STUDENTS
-        if str(student.pax_id) in favorites
-    ]
+    corpus = CORPUS.current
+    # corpus order, each student once, unknown or stale ids skipped
+    positions = sorted(
+        {i for i in corpus.index.lookup_many("pax_id", favorites) if i is not None}
+    )
+    return RawJSONResponse([corpus.payloads.basic[i] for i in positions])
 
 
 @router.patch(path="/favorites")
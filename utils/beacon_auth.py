@@ -5,6 +5,10 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+# overridable so the fetcher can run against benchmarks/beacon_stub.py
+BEACON_URL: str = os.getenv("beacon_url", "https://api.ciee.org/beacon").rstrip("/")
+
+
 def gen_auth_code():
     headers = {
     "Accept": "application/json, text/plain, */*",
@@ -25,7 +29,7 @@ def gen_auth_code():
     }
 
     response = requests.post(
-        "https://api.ciee.org/beacon/authorization/token", 
+        f"{BEACON_URL}/authorization/token",
         data=data, 
         headers=headers
     )
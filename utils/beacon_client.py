@@ -0,0 +1,125 @@
+"""Beacon placement search over a pooled keep-alive session.
+
+Page 1 is fetched first for the total count, then pages 2..N are requested
+concurrently on a bounded thread pool and handed back in page order.
+"""
+
+import math
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Iterator, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.beacon_auth import BEACON_URL, gen_auth_code
+
+BEACON_CONCURRENCY: int = int(os.getenv("beacon_concurrency", "4"))
+BEACON_PAGE_SIZE: int = int(os.getenv("beacon_page_size", "100"))
+BEACON_TIMEOUT: float = float(os.getenv("beacon_timeout", "60"))
+
+SEARCH_PATH = "/Placement/searchwithcount"
+
+
+def _saved_token() -> Optional[str]:
+    try:
+        with open("bearer_token", "r") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+class BeaconClient:
+    """Placement search client, one per refresh. Safe to use from several threads."""
+
+    def __init__(
+        self,
+        base_url: str = BEACON_URL,
+        concurrency: int = BEACON_CONCURRENCY,
+        page_size: int = BEACON_PAGE_SIZE,
+    ) -> None:
+        self.url: str = base_url.rstrip("/") + SEARCH_PATH
+        self.concurrency: int = max(1, concurrency)
+        self.page_size: int = page_size
+        # one connection per worker, kept alive between pages
+        self.session: requests.Session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency, pool_block=True)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["Accept"] = "application/json, text/plain, */*"
+        self.token: Optional[str] = _saved_token()
+        self._token_lock = threading.Lock()
+
+    def _refresh_token(self, stale: Optional[str]) -> str:
+        # several pages can be rejected at once, only the first one re-authenticates
+        with self._token_lock:
+            if self.token == stale:
+                print("Bad authorization, generating new token.")
+                self.token = gen_auth_code()
+            if self.token is None:
+                raise Exception("Unable to authenticate with beacon")
+            return self.token
+
+    def search(self, query: dict[str, Any], page: int) -> dict[str, Any]:
+        """One page of results, {"count": total, "results": [...]}."""
+        body = {**query, "page": page, "pageSize": self.page_size}
+        token = self.token or self._refresh_token(None)
+        response = self.session.post(
+            self.url, json=body, headers={"Authorization": token}, timeout=BEACON_TIMEOUT
+        )
+        if response.status_code in (401, 403):
+            token = self._refresh_token(token)
+            response = self.session.post(
+                self.url, json=body, headers={"Authorization": token}, timeout=BEACON_TIMEOUT
+            )
+        response.raise_for_status()
+        return response.json()
+
+    def iter_pages(
+        self,
+        query: dict[str, Any],
+        until: Optional[Callable[[dict[str, Any]], bool]] = None,
+    ) -> Iterator[dict[str, Any]]:
+        """Every page of the search, in page order.
+
+        At most `concurrency` requests are in flight and only as many pages are
+        buffered, so a slow consumer doesn't pull the whole result into memory.
+        With `until`, paging stops after the first page it returns True for
+        (pages already requested past it are dropped).
+        """
+        first = self.search(query, 1)
+        pages = math.ceil(first["count"] / self.page_size)
+        done = until is not None and until(first)
+        yield first
+        del first
+        if done:
+            return
+
+        with ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix="beacon"
+        ) as pool:
+            pending: deque[Future] = deque()
+            next_page = 2
+            try:
+                while next_page <= pages or pending:
+                    while next_page <= pages and len(pending) < self.concurrency:
+                        pending.append(pool.submit(self.search, query, next_page))
+                        next_page += 1
+                    page = pending.popleft().result()
+                    yield page
+                    if until is not None and until(page):
+                        return
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def close(self) -> None:
+        self.session.close()
+
+    def __enter__(self) -> "BeaconClient":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
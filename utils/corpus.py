@@ -0,0 +1,197 @@
+"""Hot reloadable student corpus.
+
+Everything derived from one version of the student data (the store, its index,
+the serialized payloads, the embedding vectors) lives in one Corpus, and the
+app only ever reads CorpusHolder.current. A reload builds the next Corpus next
+to the live one and then swaps the reference, so a request that grabbed the
+old one at its start finishes against it and nothing is ever half updated.
+Results cached per corpus are keyed by the index generation (see FilterCache).
+
+The slow part of a build (parsing the JSON, deriving the payloads, text and
+n-gram arrays, encoding vectors) is prepare(), which only writes the snapshot
+and the vector cache. A reload runs it in a separate interpreter (python -m
+utils.corpus <source>) so it never holds the GIL of the process serving
+requests; the build then just maps what it wrote.
+"""
+
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Optional
+
+from utils.corpus_snapshot import load_students
+from utils.embeddings import VectorIndex
+from utils.metrics import Counter, Gauge, Histogram, LATENCY_BUCKETS
+from utils.payloads import StudentPayloads
+from utils.student_fields import parse_students
+from utils.student_index import StudentIndex
+from utils.student_store import StudentStore
+
+CORPUS_RELOADS = Counter("corpus_reloads_total", "Student corpus reloads.", ("result",))
+CORPUS_RELOAD_SECONDS = Histogram(
+    "corpus_reload_seconds", "Time to build a new student corpus.", buckets=LATENCY_BUCKETS
+)
+
+
+_ROOT = Path(__file__).resolve().parent.parent
+
+
+def source_signature(path: Path) -> tuple[int, int]:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def vectors_directory(source: Path) -> Path:
+    return source.parent / "embeddings"
+
+
+def prepare(source: Path) -> None:
+    """Bring the snapshot and the vector cache of `source` up to date."""
+    students = load_students(source, parse_students)
+    VectorIndex.load_or_build(students=students, directory=vectors_directory(source))
+
+
+def prepare_in_subprocess(source: Path) -> None:
+    """prepare() in a separate interpreter, waiting for it to finish."""
+    result = subprocess.run(
+        [sys.executable, "-m", "utils.corpus", str(source.resolve())],
+        cwd=_ROOT,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    if result.returncode != 0:
+        lines = result.stderr.strip().splitlines()
+        raise RuntimeError(f"Preparing {source} failed: {lines[-1] if lines else result.returncode}")
+
+
+class Corpus:
+    def __init__(
+        self,
+        students: StudentStore,
+        index: StudentIndex,
+        payloads: StudentPayloads,
+        placeable_positions: list[int],
+        vectors: VectorIndex,
+        source_signature: tuple[int, int],
+    ) -> None:
+        self.students: StudentStore = students
+        self.index: StudentIndex = index
+        self.payloads: StudentPayloads = payloads
+        # allocated or unassigned, in corpus order
+        self.placeable_positions: list[int] = placeable_positions
+        self.vectors: VectorIndex = vectors
+        # (mtime, size) of the file it was built from, to tell when it is out of date
+        self.source_signature: tuple[int, int] = source_signature
+        self.loaded_at: float = time.time()
+
+    @property
+    def generation(self) -> int:
+        return self.index.generation
+
+
+class CorpusHolder:
+    """The live Corpus, and the machinery to replace it.
+
+    Builds run one at a time on a background thread; a failed build is logged
+    and the live corpus is kept. With `prepare`, a reload calls it before
+    `build` (the first build, before anything is served, doesn't).
+    """
+
+    def __init__(
+        self,
+        source: Path,
+        build: Callable[[Path], Corpus],
+        prepare: Optional[Callable[[Path], None]] = None,
+    ) -> None:
+        self.source: Path = source
+        self.build: Callable[[Path], Corpus] = build
+        self.prepare: Optional[Callable[[Path], None]] = prepare
+        self.current: Corpus = build(source)
+        self._builder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="corpus-reload")
+        self._lock = threading.Lock()
+        self._pending: Optional[Future] = None
+        # signature of the last build that failed, so the watcher doesn't retry it every poll
+        self._failed_signature: Optional[tuple[int, int]] = None
+        self.last_error: Optional[str] = None
+        Gauge("corpus_generation", "Generation of the live student corpus.", lambda: self.current.generation)
+        Gauge("corpus_students", "Students in the live corpus.", lambda: len(self.current.students))
+        Gauge(
+            "corpus_mapped_bytes",
+            "Bytes of the live corpus mapped from the snapshot and vector cache, shared between workers.",
+            lambda: self.current.students.nbytes + self.current.vectors.vectors.nbytes,
+        )
+
+    def _reload(self) -> Corpus:
+        signature = source_signature(self.source)
+        started = time.perf_counter()
+        try:
+            if self.prepare is not None:
+                self.prepare(self.source)
+            corpus = self.build(self.source)
+        except Exception as e:
+            CORPUS_RELOADS.inc(result="error")
+            self._failed_signature = signature
+            self.last_error = f"{type(e).__name__}: {e}"
+            print(f"Student corpus reload failed, keeping generation {self.current.generation}: {e}")
+            raise
+        CORPUS_RELOAD_SECONDS.observe(time.perf_counter() - started)
+        CORPUS_RELOADS.inc(result="ok")
+        previous, self.current = self.current, corpus
+        self._failed_signature = None
+        self.last_error = None
+        print(
+            f"Student corpus reloaded: generation {previous.generation} -> {corpus.generation}, "
+            f"{len(corpus.students)} students in {time.perf_counter() - started:.3f}s"
+        )
+        return corpus
+
+    def reload(self) -> Future:
+        """Start building a new corpus, or join the build already running."""
+        with self._lock:
+            if self._pending is None or self._pending.done():
+                self._pending = self._builder.submit(self._reload)
+            return self._pending
+
+    def is_stale(self) -> bool:
+        try:
+            signature = source_signature(self.source)
+        except FileNotFoundError:
+            return False
+        return signature not in (self.current.source_signature, self._failed_signature)
+
+    def watch(self, interval: float) -> threading.Thread:
+        """Reload whenever the source file changes, checking every `interval` seconds."""
+
+        def poll() -> None:
+            while True:
+                time.sleep(interval)
+                if self.is_stale():
+                    try:
+                        self.reload().result()
+                    except Exception:
+                        pass
+
+        thread = threading.Thread(target=poll, name="corpus-watcher", daemon=True)
+        thread.start()
+        return thread
+
+    def status(self) -> dict:
+        corpus = self.current
+        return {
+            "generation": corpus.generation,
+            "students": len(corpus.students),
+            "loaded_at": corpus.loaded_at,
+            "reloading": self._pending is not None and not self._pending.done(),
+            "last_error": self.last_error,
+        }
+
+
+if __name__ == "__main__":
+    # behind the workers serving requests when they compete for a core
+    if hasattr(os, "nice"):
+        os.nice(10)
+    prepare(Path(sys.argv[1]))
@@ -0,0 +1,165 @@
+"""Compiled binary snapshot of the student corpus.
+
+Parsing data/student_extra_info.json and validating a FullStudent per record is
+most of the startup time, so the StudentStore built from it is also written
+next to it as a snapshot:
+
+    b"STUSNAP\\0" | u32 header length | header JSON | padding | column data
+
+The header holds the format version, the blake2b hash of the JSON it was built
+from, the FullStudent schema and the offset of every StudentStore array,
+followed by the shared string table and the arrays derived from the columns
+(StudentStore.derived: the processed text columns and n-gram indexes of the
+free text search, the serialized payloads and the digest the vector cache is
+checked against, see derived_arrays). Every array, the string table included,
+is used straight from the mmap. It is only rebuilt when the JSON (or the
+schema, or the format) changes; bump SNAPSHOT_VERSION when what goes into the
+derived arrays changes.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+
+from models.student import FullStudent
+from utils.student_store import SCHEMA, StudentStore
+from utils.embeddings import embedding_arrays
+from utils.payloads import payload_arrays
+from utils.text_search import text_index_arrays
+
+SNAPSHOT_VERSION = 4
+_MAGIC = b"STUSNAP\0"
+_ALIGN = 8
+
+
+def snapshot_path(source: Path) -> Path:
+    return source.with_suffix(".snapshot")
+
+
+def source_hash(source: Path) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with open(source, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def derived_arrays(students: StudentStore) -> dict[str, np.ndarray]:
+    """Everything the corpus derives from the columns, computed once per source
+    and then read from the snapshot by every worker and reload."""
+    return {
+        **text_index_arrays(students),
+        **payload_arrays(students),
+        **embedding_arrays(students),
+    }
+
+
+def write_snapshot(path: Path, store: StudentStore, digest: str) -> None:
+    arrays: dict[str, np.ndarray] = dict(store.arrays)
+    arrays["strings.offsets"] = store.string_offsets
+    arrays["strings.blob"] = np.frombuffer(store.blob, dtype=np.uint8)
+    derived = set(store.derived)
+    arrays.update(store.derived)
+
+    columns: dict[str, list] = {}
+    offset = 0
+    for name, array in arrays.items():
+        columns[name] = [array.dtype.str, len(array), offset]
+        offset += -(-array.nbytes // _ALIGN) * _ALIGN
+    header = json.dumps(
+        {
+            "version": SNAPSHOT_VERSION,
+            "source_hash": digest,
+            "schema": SCHEMA,
+            "fields_set": sorted(store.fields_set),
+            "columns": columns,
+            "derived": sorted(derived),
+        }
+    ).encode()
+    prefix = _MAGIC + struct.pack("<I", len(header)) + header
+    prefix += b"\0" * (-len(prefix) % _ALIGN)
+
+    # a temp file of its own, workers and reloads may write the same snapshot at once
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(prefix)
+            for array in arrays.values():
+                data = array.tobytes()
+                f.write(data + b"\0" * (-len(data) % _ALIGN))
+        os.replace(tmp, path)
+    finally:
+        # only left behind when writing failed
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _read_header(buf: mmap.mmap) -> tuple[dict, int]:
+    if buf[: len(_MAGIC)] != _MAGIC:
+        raise ValueError("not a student snapshot")
+    (length,) = struct.unpack_from("<I", buf, len(_MAGIC))
+    start = len(_MAGIC) + 4
+    header = json.loads(buf[start : start + length])
+    data_start = start + length
+    return header, data_start + (-data_start % _ALIGN)
+
+
+def read_snapshot(path: Path, digest: str) -> Optional[StudentStore]:
+    """The snapshot's StudentStore, or None when it is missing or stale."""
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return None
+    with f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    header, data_start = _read_header(buf)
+    if (
+        header["version"] != SNAPSHOT_VERSION
+        or header["source_hash"] != digest
+        or [tuple(x) for x in header["schema"]] != SCHEMA
+    ):
+        buf.close()
+        return None
+
+    # read only views of the mapping, which stays open for as long as they live.
+    # Nothing is copied, the pages are shared with every other process using it
+    arrays: dict[str, np.ndarray] = {
+        name: np.frombuffer(buf, dtype=dtype, count=length, offset=data_start + offset)
+        for name, (dtype, length, offset) in header["columns"].items()
+    }
+    string_offsets = arrays.pop("strings.offsets")
+    blob = arrays.pop("strings.blob").data
+    derived = {name: arrays.pop(name) for name in header["derived"]}
+    return StudentStore(arrays, blob, string_offsets, set(header["fields_set"]), derived)
+
+
+def load_students(source: Path, parse: Callable[[Path], list[FullStudent]]) -> StudentStore:
+    """Students from the snapshot of `source`, rebuilding it with `parse` when stale."""
+    started = time.perf_counter()
+    digest = source_hash(source)
+    path = snapshot_path(source)
+    try:
+        students = read_snapshot(path, digest)
+    except (OSError, ValueError, KeyError, IndexError) as e:
+        print(f"Ignoring unreadable student snapshot {path}: {e}")
+        students = None
+    if students is not None:
+        print(f"Loaded {len(students)} students from {path} in {time.perf_counter() - started:.3f}s")
+        return students
+
+    students = StudentStore.from_models(parse(source))
+    students.derived.update(derived_arrays(students))
+    try:
+        write_snapshot(path, students, digest)
+    except OSError as e:
+        print(f"Could not write student snapshot {path}: {e}")
+    print(f"Loaded {len(students)} students from {source} in {time.perf_counter() - started:.3f}s")
+    return students
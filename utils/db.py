@@ -1,14 +1,30 @@
 import sqlite3
 
+import functools
 import uuid
 import json
 import hashlib
 import itertools
+import time
 from datetime import datetime
+from typing import Iterable
 import pytz
 
+from utils.metrics import DB_CALL_SECONDS
+from utils.student_store import StudentStore
+
+
+def _timed(fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with DB_CALL_SECONDS.time(function=fn.__name__):
+            return fn(*args, **kwargs)
+
+    return wrapper
+
 
 # Database setup
+@_timed
 def initialize_db() -> None:
     connection = sqlite3.connect("user_auth.db")
     connection.row_factory = sqlite3.Row
@@ -32,17 +48,30 @@ def initialize_db() -> None:
         country TEXT NOT NULL,
         program_type TEXT NOT NULL,
         adjusted_age INTEGER NOT NULL,
-        placement_status TEXT
+        placement_status TEXT,
+        source TEXT NOT NULL DEFAULT 'corpus'
     )
     """)
+    # which sync owns the row, see reconcile_students. Rows from before the
+    # column existed all came from the corpus
+    student_columns = {row[1] for row in cursor.execute("PRAGMA table_info(simple_students)")}
+    if "source" not in student_columns:
+        cursor.execute("ALTER TABLE simple_students ADD COLUMN source TEXT NOT NULL DEFAULT 'corpus'")
 
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS admin(
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         last_refresh_date TIMESTAMP,
-        auth_code TEXT NOT NULL
+        auth_code TEXT NOT NULL,
+        last_modified_watermark TEXT,
+        last_full_sync TIMESTAMP
         );
     """)
+    # columns added after the table was first created
+    admin_columns = {row[1] for row in cursor.execute("PRAGMA table_info(admin)")}
+    for column, column_type in (("last_modified_watermark", "TEXT"), ("last_full_sync", "TIMESTAMP")):
+        if column not in admin_columns:
+            cursor.execute(f"ALTER TABLE admin ADD COLUMN {column} {column_type}")
 
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS feedback( 
@@ -58,6 +87,7 @@ def initialize_db() -> None:
 
 
 # Create a new user
+@_timed
 def create_user(username, password, first_name, favorites=None) -> None:
     hashed_password = hashlib.sha256(password.encode()).hexdigest()
     user_id = str(uuid.uuid4())
@@ -83,6 +113,7 @@ def create_user(username, password, first_name, favorites=None) -> None:
 
 
 # Read user data
+@_timed
 def read_user(username="", user_id=""):
     connection = sqlite3.connect("user_auth.db")
     connection.row_factory = sqlite3.Row
@@ -109,6 +140,7 @@ def read_user(username="", user_id=""):
 
 
 # Update user data
+@_timed
 def update_user(username: str, first_name: str = "", favorites=None) -> None:
     connection = sqlite3.connect("user_auth.db")
     cursor = connection.cursor()
@@ -133,6 +165,7 @@ def update_user(username: str, first_name: str = "", favorites=None) -> None:
 
 
 # Delete a user
+@_timed
 def delete_user(username) -> None:
     connection = sqlite3.connect("user_auth.db")
     cursor = connection.cursor()
@@ -146,6 +179,7 @@ def delete_user(username) -> None:
     connection.close()
 
 
+@_timed
 def add_student(
     first_name: str,
     app_id: int,
@@ -180,6 +214,7 @@ def add_student(
         connection.close()
 
 
+@_timed
 def update_student_status(app_id: int, placement_status: str) -> None:
     connection = sqlite3.connect("user_auth.db")
     cursor = connection.cursor()
@@ -193,6 +228,7 @@ def update_student_status(app_id: int, placement_status: str) -> None:
     connection.close()
 
 
+@_timed
 def query_students(query_param: str, query_val: str):
     connection = sqlite3.connect("user_auth.db")
     connection.row_factory = sqlite3.Row
@@ -210,6 +246,7 @@ def query_students(query_param: str, query_val: str):
     return students
 
 
+@_timed
 def does_student_exist(student_id) -> tuple[int | None, str]:
     connection = sqlite3.connect("user_auth.db")
     cursor = connection.cursor()
@@ -229,6 +266,7 @@ def does_student_exist(student_id) -> tuple[int | None, str]:
     return student[0], student[1]
 
 
+@_timed
 def get_countries() -> list[str]:
     connection = sqlite3.connect("user_auth.db")
     connection.row_factory = sqlite3.Row
@@ -243,6 +281,7 @@ def get_countries() -> list[str]:
 
 
 # Read student data
+@_timed
 def read_students():
     connection = sqlite3.connect("user_auth.db")
     connection.row_factory = sqlite3.Row
@@ -257,7 +296,121 @@ def read_students():
     return students
 
 
+# Bring simple_students in line with `rows` in a single transaction. Rows are
+# (first_name, app_id, pax_id, country, program_type, adjusted_age, placement_status).
+# Two syncs write the table: the corpus (every field, SOURCE_CORPUS) and the
+# Beacon download (a summary, SOURCE_BEACON), each with its own scope. Every row
+# records its source, delete_missing only deletes rows of this `source` that
+# aren't in rows, so neither sync deletes what the other inserted. Statuses are
+# updated whoever owns the row, and with adopt rows owned by the other source
+# are rewritten from `rows` and taken over
+SOURCE_CORPUS = "corpus"
+SOURCE_BEACON = "beacon"
+
+
+@_timed
+def reconcile_students(
+    rows: Iterable[tuple], source: str, delete_missing: bool = True, adopt: bool = False
+) -> dict:
+    started = time.perf_counter()
+    connection = sqlite3.connect("user_auth.db")
+    try:
+        with connection:
+            existing: dict[int, tuple[str, str]] = {
+                app_id: (placement_status, owner)
+                for app_id, placement_status, owner in connection.execute(
+                    "SELECT app_id, placement_status, source FROM simple_students"
+                )
+            }
+            new_rows: list[tuple] = []
+            adopted_rows: list[tuple] = []
+            status_changes: list[tuple[str, int]] = []
+            current: set[int] = set()
+            unchanged = 0
+            for row in rows:
+                app_id, placement_status = row[1], row[6]
+                current.add(app_id)
+                if app_id not in existing:
+                    new_rows.append((*row, source))
+                    continue
+                status_in_db, owner = existing[app_id]
+                if adopt and owner != source:
+                    adopted_rows.append((row[0], *row[2:], source, app_id))
+                elif status_in_db != placement_status:
+                    status_changes.append((placement_status, app_id))
+                else:
+                    unchanged += 1
+            stale = (
+                [
+                    (app_id,)
+                    for app_id, (_, owner) in existing.items()
+                    if owner == source and app_id not in current
+                ]
+                if delete_missing
+                else []
+            )
+
+            # stale rows go first so their pax_ids are free for new students
+            deleted = connection.executemany(
+                "DELETE FROM simple_students WHERE app_id = ?", stale
+            ).rowcount
+            adopted = connection.executemany(
+                """
+            UPDATE OR IGNORE simple_students
+            SET first_name = ?, pax_id = ?, country = ?, program_type = ?, adjusted_age = ?, placement_status = ?, source = ?
+            WHERE app_id = ?
+            """,
+                adopted_rows,
+            ).rowcount
+            # OR IGNORE skips rows that would violate a constraint (e.g. a pax_id
+            # already taken), the same as add_student does one row at a time
+            inserted = connection.executemany(
+                """
+            INSERT OR IGNORE INTO simple_students (first_name, app_id, pax_id, country, program_type, adjusted_age, placement_status, source)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+                new_rows,
+            ).rowcount
+            updated = connection.executemany(
+                "UPDATE simple_students SET placement_status = ? WHERE app_id = ?",
+                status_changes,
+            ).rowcount
+    finally:
+        connection.close()
+
+    return {
+        "inserted": max(inserted, 0),
+        "skipped": len(new_rows) - max(inserted, 0),
+        "updated": max(updated, 0),
+        "adopted": max(adopted, 0),
+        "deleted": max(deleted, 0),
+        "unchanged": unchanged,
+        "seconds": round(time.perf_counter() - started, 4),
+    }
+
+
+# Bring simple_students in line with the loaded corpus
+def sync_students(students: StudentStore) -> dict:
+    summary = reconcile_students(
+        zip(
+            students.column("first_name"),
+            students.column("app_id"),
+            students.column("pax_id"),
+            students.column("country"),
+            students.column("program_type"),
+            students.column("adjusted_age"),
+            students.column("placement_status"),
+        ),
+        source=SOURCE_CORPUS,
+        # the corpus has every field, so it takes over rows the Beacon sync inserted
+        adopt=True,
+    )
+    print(f"student db sync: {summary}")
+    return summary
+
+
 # Delete a student
+@_timed
 def delete_student(app_id):
     connection = sqlite3.connect("user_auth.db")
     cursor = connection.cursor()
@@ -271,6 +424,7 @@ def delete_student(app_id):
     connection.close()
 
 
+@_timed
 def get_hashed_auth() -> str:
     connection = sqlite3.connect("user_auth.db")
     cursor = connection.cursor()
@@ -280,6 +434,7 @@ def get_hashed_auth() -> str:
     return auth_code[0]
 
 
+@_timed
 def update_time():
     connection = sqlite3.connect("user_auth.db")
     cursor = connection.cursor()
@@ -302,6 +457,44 @@ def update_time():
     connection.close()
 
 
+@_timed
+def get_sync_state() -> tuple[str | None, datetime | None]:
+    """(newest Beacon modifiedOn synced, time of the last full sync), None when never synced."""
+    connection = sqlite3.connect("user_auth.db")
+    cursor = connection.cursor()
+    cursor.execute("SELECT last_modified_watermark, last_full_sync FROM admin LIMIT 1")
+    row = cursor.fetchone()
+    connection.close()
+    if row is None:
+        return None, None
+    watermark, last_full_sync = row
+    return watermark, datetime.fromisoformat(last_full_sync) if last_full_sync else None
+
+
+@_timed
+def set_sync_state(watermark: str, full: bool) -> None:
+    connection = sqlite3.connect("user_auth.db")
+    cursor = connection.cursor()
+    cursor.execute("SELECT COUNT(*) FROM admin")
+    if cursor.fetchone()[0] == 0:
+        cursor.execute("INSERT INTO admin (auth_code) VALUES (?)", ("initial_code",))
+
+    now_time = datetime.now(pytz.timezone("US/Eastern"))
+    if full:
+        cursor.execute(
+            "UPDATE admin SET last_modified_watermark = ?, last_full_sync = ? WHERE id = (SELECT id FROM admin LIMIT 1)",
+            (watermark, now_time.isoformat(" ")),
+        )
+    else:
+        cursor.execute(
+            "UPDATE admin SET last_modified_watermark = ? WHERE id = (SELECT id FROM admin LIMIT 1)",
+            (watermark,),
+        )
+    connection.commit()
+    connection.close()
+
+
+@_timed
 def get_last_update_time() -> str:
     connection = sqlite3.connect(
         "user_auth.db", detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES
@@ -0,0 +1,283 @@
+import hashlib
+import importlib
+import json
+import os
+import re
+import tempfile
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Optional, Protocol
+
+import numpy as np
+
+from utils.student_store import StudentFields, StudentStore
+
+EMBEDDING_DIM: int = int(os.getenv("embedding_dim", "256"))
+
+# filtered searches copy out the rows when they are at most this fraction of the
+# matrix, otherwise they score all of it (see VectorIndex.search)
+GATHER_FRACTION = 0.125
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def student_to_embedding_text(student: StudentFields) -> str:
+    """Convert a student (a FullStudent or StudentView) into a human-readable text block for embedding."""
+    parts: list[str] = []
+
+    if student.gender_desc:
+        parts.append(f"Gender: {student.gender_desc}")
+    if student.selected_interests:
+        parts.append(f"Interests: {', '.join(student.selected_interests)}")
+    if student.family_description:
+        parts.append(f"Family Description: {student.family_description}")
+    if student.favorite_subjects:
+        parts.append(f"Favorite Subjects: {student.favorite_subjects}")
+    if student.photo_comments:
+        parts.append(f"Photo Comments: {student.photo_comments}")
+    if student.religion:
+        parts.append(f"Religion: {student.religion}")
+    if student.allergy_comments:
+        parts.append(f"Allergy Comments: {student.allergy_comments}")
+    if student.dietary_restrictions:
+        parts.append(f"Dietary Restrictions: {student.dietary_restrictions}")
+    if student.intro_message:
+        parts.append(f"Introduction: {student.intro_message}")
+    if student.message_to_host_family:
+        parts.append(f"Message to Host Family: {student.message_to_host_family}")
+    if student.message_from_natural_family:
+        parts.append(f"Message from Natural Family: {student.message_from_natural_family}")
+    if student.health_comments:
+        parts.append(f"Health Comments: {', '.join(student.health_comments)}")
+
+    return "\n".join(parts)
+
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return (vectors / norms).astype(np.float32)
+
+
+class Embedder(Protocol):
+    name: str
+    dim: int
+
+    def fit(self, texts: list[str]) -> None: ...
+
+    def encode(self, texts: list[str]) -> np.ndarray: ...
+
+    def state(self) -> dict[str, Any]: ...
+
+    def load_state(self, state: dict[str, Any]) -> None: ...
+
+
+@lru_cache(maxsize=65536)
+def _bucket(token: str, dim: int) -> int:
+    # python's hash() is salted per process, the buckets have to survive restarts
+    digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") % dim
+
+
+class HashingEmbedder:
+    """TF-IDF over hashed word and word-pair buckets, no model download needed."""
+
+    name = "hashing-tfidf"
+
+    def __init__(self, dim: int = EMBEDDING_DIM) -> None:
+        self.dim: int = dim
+        self.idf: np.ndarray = np.ones(dim, dtype=np.float32)
+
+    def _counts(self, text: str) -> np.ndarray:
+        tokens = _TOKEN_RE.findall(text.lower())
+        tokens += [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        counts = np.zeros(self.dim, dtype=np.float32)
+        for token in tokens:
+            counts[_bucket(token, self.dim)] += 1
+        return counts
+
+    def fit(self, texts: list[str]) -> None:
+        df = np.zeros(self.dim, dtype=np.float32)
+        for text in texts:
+            df += self._counts(text) > 0
+        self.idf = (np.log((1 + len(texts)) / (1 + df)) + 1).astype(np.float32)
+
+    def encode(self, texts: list[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        counts = np.stack([self._counts(t) for t in texts])
+        return _normalize_rows(np.log1p(counts) * self.idf)
+
+    def state(self) -> dict[str, Any]:
+        return {"idf": self.idf.tolist()}
+
+    def load_state(self, state: dict[str, Any]) -> None:
+        self.idf = np.asarray(state["idf"], dtype=np.float32)
+
+
+class SentenceTransformerEmbedder:
+    """Wraps a sentence-transformers model, only usable if that package is installed."""
+
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2") -> None:
+        # optional and not in the lock file, resolved only when it is asked for
+        sentence_transformers = importlib.import_module("sentence_transformers")
+        self.model = sentence_transformers.SentenceTransformer(model_name)
+        self.name: str = f"sentence-transformers/{model_name}"
+        self.dim: int = self.model.get_sentence_embedding_dimension()
+
+    def fit(self, texts: list[str]) -> None:
+        pass
+
+    def encode(self, texts: list[str]) -> np.ndarray:
+        vectors = self.model.encode(texts, normalize_embeddings=True)
+        return np.asarray(vectors, dtype=np.float32).reshape(len(texts), self.dim)
+
+    def state(self) -> dict[str, Any]:
+        return {}
+
+    def load_state(self, state: dict[str, Any]) -> None:
+        pass
+
+
+def get_embedder() -> Embedder:
+    if os.getenv("embedder", "hashing") == "sentence-transformers":
+        return SentenceTransformerEmbedder()
+    return HashingEmbedder()
+
+
+def texts_digest(texts: list[str]) -> bytes:
+    h = hashlib.sha256()
+    for text in texts:
+        h.update(b"\0")
+        h.update(text.encode("utf-8"))
+    return h.digest()
+
+
+def embedding_arrays(students: StudentStore) -> dict[str, np.ndarray]:
+    """Digest of every student's embedding text, for StudentStore.derived, so
+    checking the cached vectors doesn't need the texts."""
+    texts = [student_to_embedding_text(s) for s in students]
+    return {"embeddings.texts_digest": np.frombuffer(texts_digest(texts), dtype=np.uint8)}
+
+
+def _write_replacing(path: Path, mode: str, write: Callable[[Any], Any]) -> None:
+    """Write `path` through a temp file of its own, concurrent builds may race."""
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode) as f:
+            write(f)
+        os.replace(tmp, path)
+    finally:
+        # only left behind when writing failed
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def corpus_fingerprint(embedder: Embedder, digest: bytes) -> str:
+    h = hashlib.sha256(f"{embedder.name}:{embedder.dim}".encode())
+    h.update(digest)
+    return h.hexdigest()
+
+
+class VectorIndex:
+    """Normalized float32 student vectors, row i belonging to students[i].
+
+    The matrix lives in a .npy file named in a small meta.json and is opened
+    with mmap, so a restart only re-encodes when the corpus or the embedder
+    changed.
+    """
+
+    def __init__(self, embedder: Embedder, vectors: np.ndarray, app_ids: list[int]) -> None:
+        self.embedder: Embedder = embedder
+        self.vectors: np.ndarray = vectors
+        self.app_ids: list[int] = app_ids
+
+    @classmethod
+    def load_or_build(
+        cls, students: StudentStore, directory: Path, embedder: Optional[Embedder] = None
+    ) -> "VectorIndex":
+        embedder = embedder or get_embedder()
+        texts: Optional[list[str]] = None
+        if "embeddings.texts_digest" in students.derived:
+            digest = students.derived["embeddings.texts_digest"].tobytes()
+        else:
+            texts = [student_to_embedding_text(s) for s in students]
+            digest = texts_digest(texts)
+        app_ids = students.column("app_id")
+        fingerprint = corpus_fingerprint(embedder, digest)
+
+        meta_path = directory / "meta.json"
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta["fingerprint"] == fingerprint and meta["app_ids"] == app_ids:
+                embedder.load_state(meta["embedder_state"])
+                vectors = np.load(directory / meta["vectors"], mmap_mode="r")
+                if vectors.shape == (len(app_ids), embedder.dim):
+                    return cls(embedder, vectors, app_ids)
+        except (FileNotFoundError, json.JSONDecodeError, KeyError, ValueError):
+            pass
+
+        if texts is None:
+            texts = [student_to_embedding_text(s) for s in students]
+        embedder.fit(texts)
+        vectors = embedder.encode(texts)
+        directory.mkdir(parents=True, exist_ok=True)
+        # the vectors are named after their fingerprint and never rewritten with
+        # anything else, and meta.json (what readers go by) is only replaced once
+        # they are in place, so a reader sees the old pair or the new one
+        vectors_path = directory / f"student_vectors.{fingerprint[:16]}.npy"
+        _write_replacing(vectors_path, "wb", lambda f: np.save(f, vectors))
+        meta = {
+            "fingerprint": fingerprint,
+            "embedder": embedder.name,
+            "dim": embedder.dim,
+            "vectors": vectors_path.name,
+            "app_ids": app_ids,
+            "embedder_state": embedder.state(),
+        }
+        _write_replacing(meta_path, "w", lambda f: json.dump(meta, f))
+        for old in directory.glob("student_vectors*.npy"):
+            if old != vectors_path:
+                # a reader still holding the old meta.json rebuilds if it loses this race
+                old.unlink(missing_ok=True)
+        try:
+            return cls(embedder, np.load(vectors_path, mmap_mode="r"), app_ids)
+        except FileNotFoundError:
+            # removed by a concurrent build of another corpus, keep our copy
+            return cls(embedder, vectors, app_ids)
+
+    def search(
+        self, query: str, k: int, positions: Optional[np.ndarray] = None
+    ) -> list[tuple[int, float]]:
+        """Top k (row, cosine score) pairs, best first, optionally limited to `positions`.
+
+        An exact scan of every row it scores. Reading the matrix bounds it: 100k
+        x 256 float32 rows take about 10ms on one core, linear in both.
+        Filters covering up to GATHER_FRACTION of the rows are cheaper (5k rows
+        about 1ms); sub-millisecond search over the whole corpus at that size
+        would need an approximate index.
+        """
+        query_vector = self.embedder.encode([query])[0]
+        rows: Optional[np.ndarray] = None
+        if positions is None:
+            scores = self.vectors @ query_vector
+        elif len(positions) <= GATHER_FRACTION * len(self.vectors):
+            # few rows, copying them is less to read than the whole matrix
+            rows = np.asarray(positions, dtype=np.intp)
+            scores = self.vectors[rows] @ query_vector
+        else:
+            # score every row in place and drop the ones outside the filter
+            scores = self.vectors @ query_vector
+            outside = np.ones(len(scores), dtype=bool)
+            outside[positions] = False
+            scores[outside] = -np.inf
+
+        k = min(k, len(scores) if positions is None else len(positions))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        if rows is not None:
+            return [(int(rows[i]), float(scores[i])) for i in top]
+        return [(int(i), float(scores[i])) for i in top]
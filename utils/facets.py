@@ -0,0 +1,101 @@
+from functools import reduce
+from operator import or_
+
+from models.search_filters import SearchFilters
+
+from utils.query_planner import QueryPlan
+from utils.student_index import (
+    GRANT_PREFIXES,
+    PROGRAM_TYPE_MAPPING,
+    StudentIndex,
+    bits_from_positions,
+    iter_bits,
+)
+
+# facet name -> name of the predicate that filters on it
+FACETS: dict[str, str] = {
+    "status": "statusOptions",
+    "country": "country_of_origin",
+    "program_type": "program_types",
+    "state": "state",
+    "grants": "grants_options",
+    "gender": "gender",
+}
+
+
+def _facet_bitsets(index: StudentIndex) -> dict[str, dict[str, int]]:
+    """Bitset per displayed facet value, keyed the way the UI sends it back as a filter."""
+    labels = index.labels
+    grant_prefixes = {x.lower() for x in GRANT_PREFIXES}
+    grants = {prefix: b for prefix, b in index.grant_prefix.items()}
+    grants["grant"] = 0
+    for prefix, b in index.grant_prefix.items():
+        if prefix in grant_prefixes:
+            grants["grant"] |= b
+    return {
+        # statusOptions matches by substring ("Placed" also selects "Placed - Accepted"),
+        # so each count covers every status the value would select
+        "status": {
+            labels["placement_status"][value]: reduce(
+                or_,
+                (b for status, b in index.placement_status.items() if value in status),
+                0,
+            )
+            for value in index.placement_status
+        },
+        "country": {labels["country"][v]: b for v, b in index.country.items()},
+        "program_type": {
+            option: reduce(
+                or_,
+                (b for program_type, b in index.program_type.items() if text in program_type),
+                0,
+            )
+            for option, text in PROGRAM_TYPE_MAPPING.items()
+        },
+        "state": {labels["state"][v]: b for v, b in index.state.items()},
+        "grants": grants,
+        "gender": {labels["gender"][v]: b for v, b in index.gender.items()},
+    }
+
+
+def facet_counts(index: StudentIndex, filters: SearchFilters) -> dict:
+    """Match counts for every facet value under all the *other* active filters.
+
+    Each predicate bitset is computed once; the mask excluding one facet is the
+    AND of the shared part with every other facet's bitset.
+    """
+    plan = QueryPlan(index, filters)
+    facet_names = set(FACETS.values())
+
+    shared = index.all
+    by_facet: dict[str, int] = {}
+    for pred in plan.structured:
+        if pred.name in facet_names:
+            by_facet[pred.name] = pred.bitset(index.all)
+        else:
+            shared = pred.bitset(shared)
+
+    if plan.has_text_steps:
+        # fuzzy stages do not depend on the facets, so score the shared
+        # candidates once and treat the survivors as one more bitset
+        shared = bits_from_positions(
+            plan.text_matches(list(iter_bits(shared))), index.size
+        )
+
+    matched = shared
+    for b in by_facet.values():
+        matched &= b
+
+    facets: dict[str, dict[str, int]] = {}
+    for facet, values in _facet_bitsets(index).items():
+        base = shared
+        for name, b in by_facet.items():
+            if name != FACETS[facet]:
+                base &= b
+        facets[facet] = {
+            value: count
+            for value, b in sorted(values.items())
+            if (count := (base & b).bit_count())
+        }
+
+    return {"total_results": matched.bit_count(), "facets": facets}
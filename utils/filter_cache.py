@@ -0,0 +1,230 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Union
+
+import numpy as np
+from rapidfuzz import utils
+
+from models.search_filters import SearchFilters
+from utils.metrics import Counter
+from utils.student_index import NUMERIC_COLUMNS, PETS_MAPPING, StudentIndex
+
+FILTER_CACHE_MB: int = int(os.getenv("filter_cache_mb", "64"))
+
+FILTER_CACHE_LOOKUPS = Counter(
+    "filter_cache_lookups_total", "Filter cache lookups by result.", ("result",)
+)
+FILTER_CACHE_EVICTIONS = Counter("filter_cache_evictions_total", "Filter cache evictions.")
+
+
+def _all_or(value: Optional[str], normalize: Callable[[str], Any] = str.lower) -> Any:
+    if not value or value == "all":
+        return None
+    return normalize(value)
+
+
+def _number(value: Optional[str], parse: Callable[[str], Any]) -> Any:
+    if not value or value == "all":
+        return None
+    try:
+        return parse(value)
+    except ValueError:
+        return None
+
+
+def _yes_no(value: Optional[str]) -> Optional[str]:
+    if value is None or value == "all" or value.lower() not in ("yes", "no"):
+        return None
+    return value.lower()
+
+
+def filter_key(filters: SearchFilters) -> tuple:
+    """Hashable key that is equal for any two filters selecting the same students.
+
+    Mirrors the semantics of StudentIndex.predicates and the text stages: values
+    that are ignored there ("all", None, ("All",), both genders, an unparsable
+    gpa...) collapse to None, case insensitive values are lowercased, option
+    tuples are sorted and text queries are run through the same processor.
+    """
+    status = None
+    if filters.statusOptions is not None and "All" not in filters.statusOptions:
+        status = tuple(sorted({x.lower() for x in filters.statusOptions}))
+
+    gender = None
+    if filters.gender_female is not None and filters.gender_male is not None:
+        if filters.gender_female is True and filters.gender_male is not True:
+            gender = "female"
+        elif filters.gender_male is True and filters.gender_female is not True:
+            gender = "male"
+
+    interests = None
+    if filters.interests and filters.interests.lower() != "all":
+        interests = filters.interests
+
+    pets = None
+    if filters.pets_in_home is not None and filters.pets_in_home != "all":
+        # wrapped so "matches students with unknown pets" differs from "no filter"
+        pets = (PETS_MAPPING.get(filters.pets_in_home),)
+
+    early_placement = None
+    if filters.early_placement is not None and filters.early_placement != "all":
+        early_placement = filters.early_placement.lower() == "yes"
+
+    religious_practice = None
+    if filters.religiousPractice is not None and filters.religiousPractice != "all":
+        religious_practice = filters.religiousPractice
+
+    program_types = None
+    if filters.program_types:
+        program_types = tuple(sorted(set(filters.program_types)))
+
+    grants = None
+    if filters.grants_options:
+        if "grant" in filters.grants_options:
+            grants = ("grant",)
+        else:
+            grants = tuple(sorted(set(filters.grants_options)))
+
+    return (
+        status,
+        gender,
+        _all_or(filters.state),
+        interests,
+        _number(filters.gpa, float),
+        pets,
+        filters.usahsId.lower() if filters.usahsId else None,
+        _all_or(filters.country_of_origin),
+        _number(filters.adjusted_age, int),
+        _yes_no(filters.single_placement),
+        _yes_no(filters.double_placement),
+        program_types,
+        early_placement,
+        True if filters.hasVideo is True else None,
+        religious_practice,
+        grants,
+        utils.default_process(filters.photo_search) if filters.photo_search else None,
+        utils.default_process(filters.free_text) if filters.free_text else None,
+        tuple(
+            (float(low) if low is not None else None, float(high) if high is not None else None)
+            for low, high in (
+                (getattr(filters, f"{c}_min"), getattr(filters, f"{c}_max"))
+                for c in NUMERIC_COLUMNS
+            )
+        ),
+    )
+
+
+class FilterCache:
+    """LRU cache of filter results as int32 position arrays, bounded by bytes.
+
+    Entries are keyed by the index generation as well as the canonical filter,
+    so results computed against an older corpus are never served once a new
+    StudentIndex is in use, and are dropped the first time that is noticed.
+
+    `variant` tells apart different arrays derived from the same filter, such as
+    the result sorted on some order key (see StudentIndex.sorted_ranks). Only
+    lookups of the filter results themselves count as hits and misses, a
+    variant is looked up in the same request that already counted one.
+    """
+
+    def __init__(self, max_bytes: int = FILTER_CACHE_MB * 1024 * 1024) -> None:
+        self.max_bytes: int = max_bytes
+        self._entries: OrderedDict[Hashable, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation: int = -1
+        self.bytes: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+    def _evict(self, key: Hashable) -> None:
+        self.bytes -= self._entries.pop(key).nbytes
+        self.evictions += 1
+        FILTER_CACHE_EVICTIONS.inc()
+
+    def _check_generation(self, generation: int) -> None:
+        if generation > self._generation:
+            for key in list(self._entries):
+                self._evict(key)
+            self._generation = generation
+
+    def peek(
+        self, index: StudentIndex, filters: SearchFilters, variant: Hashable = None
+    ) -> Optional[np.ndarray]:
+        """Like get, but neither counted in the stats nor refreshing the LRU order."""
+        key = (index.generation, filter_key(filters), variant)
+        with self._lock:
+            self._check_generation(index.generation)
+            return self._entries.get(key)
+
+    def get(
+        self, index: StudentIndex, filters: SearchFilters, variant: Hashable = None
+    ) -> Optional[np.ndarray]:
+        key = (index.generation, filter_key(filters), variant)
+        with self._lock:
+            self._check_generation(index.generation)
+            positions = self._entries.get(key)
+            if positions is None:
+                if variant is None:
+                    self.misses += 1
+                    FILTER_CACHE_LOOKUPS.inc(result="miss")
+                return None
+            self._entries.move_to_end(key)
+            if variant is None:
+                self.hits += 1
+                FILTER_CACHE_LOOKUPS.inc(result="hit")
+            return positions
+
+    def put(
+        self,
+        index: StudentIndex,
+        filters: SearchFilters,
+        positions: Union[list[int], np.ndarray],
+        variant: Hashable = None,
+    ) -> np.ndarray:
+        array = np.asarray(positions, dtype=np.int32)
+        array.setflags(write=False)
+        key = (index.generation, filter_key(filters), variant)
+        with self._lock:
+            self._check_generation(index.generation)
+            if index.generation < self._generation or array.nbytes > self.max_bytes:
+                return array
+            if key in self._entries:
+                self.bytes -= self._entries.pop(key).nbytes
+            self._entries[key] = array
+            self.bytes += array.nbytes
+            while self.bytes > self.max_bytes:
+                self._evict(next(iter(self._entries)))
+        return array
+
+    def get_or_compute(
+        self,
+        index: StudentIndex,
+        filters: SearchFilters,
+        compute: Callable[[], Union[list[int], np.ndarray]],
+        variant: Hashable = None,
+    ) -> np.ndarray:
+        positions = self.get(index, filters, variant)
+        if positions is None:
+            positions = self.put(index, filters, compute(), variant)
+        return positions
+
+    def clear(self) -> None:
+        with self._lock:
+            for key in list(self._entries):
+                self._evict(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "generation": self._generation,
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,116 @@
+import json
+from typing import Any, Iterator, Optional, TextIO
+
+_WHITESPACE = " \t\n\r"
+
+
+class _Reader:
+    """A sliding window over a text file for json.JSONDecoder.raw_decode."""
+
+    def __init__(self, f: TextIO, chunk_size: int) -> None:
+        self.f: TextIO = f
+        self.chunk_size: int = chunk_size
+        self.buf: str = ""
+        self.pos: int = 0
+        self.eof: bool = False
+
+    def fill(self) -> bool:
+        """Read another chunk, dropping what has been consumed. False at EOF."""
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Next non whitespace character, "" at EOF."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, chars: str) -> str:
+        c = self.peek()
+        if c == "" or c not in chars:
+            raise ValueError(f"Expected one of {chars!r} at offset {self.pos}, got {c!r}")
+        self.pos += 1
+        return c
+
+    def value(self, decoder: json.JSONDecoder) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.fill():
+                    continue
+                raise
+            # a number near the end of the window may continue in the next chunk
+            # ("12" then "3", or "1" then "e" / "1e+" / "1." with digits to follow)
+            if len(self.buf) - end <= 2 and self.fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_json_array(
+    f: TextIO, key: Optional[str] = None, chunk_size: int = 1 << 16
+) -> Iterator[Any]:
+    """Yield the items of a JSON array one at a time, without loading the whole file.
+
+    The array is the whole document, or with `key` the value of that member of a
+    top level object, e.g. {"results": [...]}. Only one item (plus a chunk of
+    the file) is held in memory at a time.
+    """
+    decoder = json.JSONDecoder()
+    reader = _Reader(f, chunk_size)
+
+    if key is not None:
+        reader.expect("{")
+        if reader.peek() == "}":
+            raise KeyError(key)
+        while True:
+            name = reader.value(decoder)
+            reader.expect(":")
+            if name == key:
+                break
+            reader.value(decoder)
+            if reader.expect(",}") == "}":
+                raise KeyError(key)
+
+    reader.expect("[")
+    if reader.peek() == "]":
+        return
+    while True:
+        yield reader.value(decoder)
+        if reader.expect(",]") == "]":
+            return
+
+
+class JSONArrayWriter:
+    """Writes {"<key>": [item, item, ...]} one item at a time, the inverse of iter_json_array."""
+
+    def __init__(self, f: TextIO, key: Optional[str] = None) -> None:
+        self.f: TextIO = f
+        self.key: Optional[str] = key
+        self.count: int = 0
+
+    def __enter__(self) -> "JSONArrayWriter":
+        self.f.write("[" if self.key is None else "{" + json.dumps(self.key) + ": [")
+        return self
+
+    def write(self, item: Any) -> None:
+        if self.count:
+            self.f.write(", ")
+        json.dump(item, self.f)
+        self.count += 1
+
+    def __exit__(self, *exc) -> None:
+        self.f.write("]" if self.key is None else "]}")
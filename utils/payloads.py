@@ -0,0 +1,87 @@
+import json
+from typing import Any
+
+import numpy as np
+from fastapi import Response
+
+from models.student import BasicStudent
+from utils.student_store import StudentStore, pack_bytes
+
+_BASIC_FIELDS = set(BasicStudent.model_fields)
+
+
+class RawJSON(bytes):
+    """Already serialized JSON, inserted verbatim by render_json."""
+
+
+def render_json(value: Any) -> bytes:
+    """json.dumps for plain dicts/lists/scalars that may contain RawJSON fragments."""
+    if isinstance(value, RawJSON):
+        return value
+    if isinstance(value, dict):
+        return (
+            b"{"
+            + b",".join(
+                json.dumps(str(k)).encode() + b":" + render_json(v) for k, v in value.items()
+            )
+            + b"}"
+        )
+    if isinstance(value, (list, tuple)):
+        return b"[" + b",".join(render_json(v) for v in value) + b"]"
+    return json.dumps(value).encode()
+
+
+class RawJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return render_json(content)
+
+
+class Fragments:
+    """RawJSON per student, sliced out of one buffer (see pack_bytes)."""
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray) -> None:
+        self.blob: memoryview = blob.data
+        self.offsets: np.ndarray = offsets
+
+    def __getitem__(self, i: int) -> RawJSON:
+        return RawJSON(self.blob[self.offsets[i] : self.offsets[i + 1]])
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+
+def payload_arrays(students: StudentStore) -> dict[str, np.ndarray]:
+    """Every student's Basic and Full JSON as arrays, for StudentStore.derived."""
+    basic: list[bytes] = []
+    full: list[bytes] = []
+    for i in range(len(students)):
+        # each model only lives long enough to be serialized
+        student = students.model(i)
+        basic.append(student.model_dump_json(include=_BASIC_FIELDS).encode())
+        full.append(student.model_dump_json().encode())
+    arrays: dict[str, np.ndarray] = {}
+    for name, values in (("basic", basic), ("full", full)):
+        arrays[f"payloads.{name}.blob"], arrays[f"payloads.{name}.offsets"] = pack_bytes(values)
+    return arrays
+
+
+class StudentPayloads:
+    """JSON bytes of every student's Basic and Full projection, serialized once.
+
+    Responses are stitched together from these fragments, so pydantic never runs
+    on the request path. Serialized with the snapshot (see payload_arrays) and
+    read from it, otherwise here. Rebuild it together with the student list.
+    """
+
+    def __init__(self, students: StudentStore) -> None:
+        arrays = students.derived
+        if "payloads.full.offsets" not in arrays:
+            arrays = payload_arrays(students)
+        self.basic: Fragments = Fragments(
+            arrays["payloads.basic.blob"], arrays["payloads.basic.offsets"]
+        )
+        self.full: Fragments = Fragments(
+            arrays["payloads.full.blob"], arrays["payloads.full.offsets"]
+        )
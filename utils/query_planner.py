@@ -0,0 +1,106 @@
+import time
+from typing import Callable, NamedTuple, Optional
+
+from models.search_filters import SearchFilters
+
+from utils.metrics import SEARCH_STAGE_SECONDS, SEARCH_STAGE_SURVIVORS
+from utils.student_index import Predicate, StudentIndex, iter_bits
+
+
+class TextStep(NamedTuple):
+    name: str
+    # relative cost, roughly the number of text columns scored per student
+    cost: int
+    run: Callable[[list[int]], list[int]]
+
+
+class QueryPlan:
+    """Ordered predicate pipeline for one SearchFilters.
+
+    Structured predicates run first, cheapest and most selective first, each only
+    over what the previous ones left, and stop as soon as nothing is left. The
+    fuzzy text stages only ever see the survivors.
+    """
+
+    def __init__(self, index: StudentIndex, filters: SearchFilters) -> None:
+        self.index: StudentIndex = index
+        self.structured: list[Predicate] = sorted(
+            index.predicates(filters), key=lambda p: (p.cost, p.estimate)
+        )
+        self.text: list[TextStep] = []
+        # TODO: Switch to embeddings
+        if filters.photo_search is not None and filters.photo_search != "":
+            photo_search = filters.photo_search
+            self.text.append(
+                TextStep(
+                    name="photo_search",
+                    cost=1,
+                    run=lambda p: index.text.photo_matches(photo_search, p),
+                )
+            )
+        if filters.free_text is not None and filters.free_text != "":
+            free_text = filters.free_text
+            self.text.append(
+                TextStep(
+                    name="free_text",
+                    cost=len(index.text.columns),
+                    run=lambda p: index.text.free_text_matches(free_text, p),
+                )
+            )
+        self.text.sort(key=lambda step: step.cost)
+        # (step name, students left after it, seconds spent) from the last run
+        self.trace: list[tuple[str, int, float]] = []
+
+    def _record(self, name: str, survivors: int, started: float) -> None:
+        seconds = time.perf_counter() - started
+        self.trace.append((name, survivors, seconds))
+        SEARCH_STAGE_SECONDS.observe(seconds, stage=name)
+        SEARCH_STAGE_SURVIVORS.observe(survivors, stage=name)
+
+    def mask(self) -> int:
+        mask = self.index.all
+        for pred in self.structured:
+            started = time.perf_counter()
+            mask = pred.bitset(mask)
+            self._record(pred.name, mask.bit_count(), started)
+            if mask == 0:
+                break
+        return mask
+
+    def text_matches(self, positions: list[int]) -> list[int]:
+        for step in self.text:
+            if not positions:
+                break
+            started = time.perf_counter()
+            positions = step.run(positions)
+            self._record(step.name, len(positions), started)
+        return positions
+
+    def execute(self) -> list[int]:
+        self.trace = []
+        return self.text_matches(list(iter_bits(self.mask())))
+
+    def explain(self) -> list[dict]:
+        """Every planned step in execution order, with what happened in the last run."""
+        ran = {name: (survivors, seconds) for name, survivors, seconds in self.trace}
+        steps: list[tuple[str, Optional[int], int]] = [
+            (p.name, p.estimate, p.cost) for p in self.structured
+        ]
+        steps += [(step.name, None, step.cost) for step in self.text]
+        plan = []
+        for name, estimate, cost in steps:
+            survivors, seconds = ran.get(name, (None, None))
+            plan.append(
+                {
+                    "step": name,
+                    "estimate": estimate,
+                    "cost": cost,
+                    "survivors": survivors,
+                    "ms": None if seconds is None else round(seconds * 1000, 3),
+                }
+            )
+        return plan
+
+    @property
+    def has_text_steps(self) -> bool:
+        return len(self.text) != 0
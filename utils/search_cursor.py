@@ -0,0 +1,85 @@
+import base64
+import hashlib
+import json
+from typing import Any, NamedTuple
+
+from models.search_filters import SearchFilters
+from utils.filter_cache import filter_key
+from utils.student_index import StudentIndex
+
+
+class StaleCursorError(ValueError):
+    """The cursor was issued against a different corpus generation."""
+
+
+class SearchCursor(NamedTuple):
+    generation: int
+    # digest of the canonical filter, so a cursor can't be replayed with other filters
+    filters: str
+    order_by: str
+    descending: bool
+    # last row of the previous page
+    order_value: Any
+    app_id: int
+    rank: int
+
+
+def filter_digest(filters: SearchFilters) -> str:
+    return hashlib.blake2b(repr(filter_key(filters)).encode(), digest_size=12).hexdigest()
+
+
+def encode_cursor(cursor: SearchCursor) -> str:
+    raw = json.dumps(list(cursor), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> SearchCursor:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        cursor = SearchCursor(*json.loads(raw))
+    except (ValueError, TypeError) as e:
+        raise ValueError("Malformed cursor") from e
+    return cursor
+
+
+def cursor_after(
+    index: StudentIndex, filters: SearchFilters, order_by: str, descending: bool, position: int
+) -> str:
+    """Cursor for the page that follows the row at `position`."""
+    student = index.students[position]
+    return encode_cursor(
+        SearchCursor(
+            generation=index.generation,
+            filters=filter_digest(filters),
+            order_by=order_by,
+            descending=descending,
+            order_value=getattr(student, order_by),
+            app_id=student.app_id,
+            rank=int(index.rank[(order_by, descending)][position]),
+        )
+    )
+
+
+def resume_rank(
+    index: StudentIndex, filters: SearchFilters, token: str, order_by: str, descending: bool
+) -> int:
+    """Rank (see StudentIndex.rank) of the last row the cursor has already returned.
+
+    Raises StaleCursorError when the corpus changed since the cursor was issued and
+    ValueError when it doesn't belong to this search.
+    """
+    cursor = decode_cursor(token)
+    if cursor.generation != index.generation:
+        raise StaleCursorError("Student data changed, restart from the first page")
+    if (
+        cursor.filters != filter_digest(filters)
+        or cursor.order_by != order_by
+        or cursor.descending != descending
+    ):
+        raise ValueError("Cursor belongs to a different search")
+    if not isinstance(cursor.rank, int) or not 0 <= cursor.rank < index.size:
+        raise ValueError("Malformed cursor")
+    student = index.students[index.order[(order_by, descending)][cursor.rank]]
+    if student.app_id != cursor.app_id or getattr(student, order_by) != cursor.order_value:
+        raise ValueError("Malformed cursor")
+    return cursor.rank
@@ -0,0 +1,81 @@
+"""Raw Beacon student records to FullStudent, and the cleanup of their values.
+
+The corpus load (parse_students) and the Beacon sync (utils.update_db) both
+write simple_students, so they have to turn the raw values into the same
+stored ones or each sync would keep "correcting" what the other wrote.
+
+Kept free of import time side effects, the corpus snapshot is built in a
+subprocess that imports parse_students (see utils.corpus).
+"""
+
+from pathlib import Path
+
+from models.student import FullStudent
+from utils.json_stream import iter_json_array
+
+
+def program_type_label(program: str) -> str:
+    """ "2026 High School USA January 10 Month Exchange" -> "January 10 Month"."""
+    return (
+        program.replace("High School USA ", "")
+        .replace("Exchange", "")
+        .replace("2026 ", "")
+        .strip()
+    )
+
+
+def placement_status_label(status: str) -> str:
+    """Beacon sends statuses uppercase, "PLACED - ACCEPTED" -> "Placed - Accepted"."""
+    return status.title()
+
+
+def full_student(student: dict) -> FullStudent:
+    """The FullStudent of one record of data/student_extra_info.json."""
+    return FullStudent(
+        first_name=student["namefirst"],
+        app_id=student["applicationid"],
+        pax_id=student["participantid"],
+        country=student["residenceCountry"],
+        gpa=student["schoolInfoGPA"],
+        english_score=student["englishTestScore"],
+        applying_to_grade=student["gradeApplyingTo"],
+        usahsid=student["usahsId"],
+        program_type=program_type_label(student["program_type"]),
+        adjusted_age=student["adjusted_age"],
+        gender_desc=student["genderdescription"],
+        id=student["student_id"],
+        current_grade=student["currentGradeLevel"],
+        status=student["statussystemname"],
+        states=student["states"],
+        early_placement=student["early_placement"],
+        urban_request=student["urban"],
+        single_placement=student["single_placement"],
+        double_placement=student["double_placement"],
+        free_text_interests=student["interests"]["free_text"],
+        family_description=student["interests"]["family_description"],
+        favorite_subjects=student["interests"]["favorite_subject"],
+        selected_interests=student["interests"]["selectables"],
+        photo_comments=student["photo_comments"],
+        religion=student["religion"],
+        allergy_comments=student["allergies_comment"],
+        dietary_restrictions=student["diet_comment"],
+        religious_frequency=student["religiousFrequency"],
+        intro_message=student["messages"][0],
+        message_to_host_family=student["messages"][1],
+        message_from_natural_family=student["messages"][2],
+        media_link=student.get("media_link", ""),
+        health_comments=student["health_comments"],
+        live_with_pets=student["can_live_w_pets"],
+        placement_status=placement_status_label(student["placementStatusName"]),
+    )
+
+
+def parse_students(path: Path) -> list[FullStudent]:
+    # records are parsed one at a time, so only the models are ever held in full
+    with open(path) as f:
+        return [
+            full_student(s)
+            for s in iter_json_array(f)
+            if s.get("namefirst").lower() != "test"
+            and s.get("statussystemname").lower() != "canceled"
+        ]
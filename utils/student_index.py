@@ -0,0 +1,510 @@
+import itertools
+import math
+from bisect import bisect_right
+from collections import defaultdict
+from typing import Any, Callable, Iterable, Iterator, NamedTuple, Optional
+
+import numpy as np
+
+from models.search_filters import SearchFilters
+from utils.student_store import StudentStore
+from utils.text_search import TextStore
+
+GRANT_PREFIXES = ["CBE", "CBX", "FAO", "FLX", "YES", "CBG"]
+
+PROGRAM_TYPE_MAPPING = {
+    "10-month-aug": "August 10",
+    "5-month-aug": "August 5",
+    "10-month-jan": "January 10",
+    "5-month-jan": "January 5",
+}
+
+RELIGIOUS_PRACTICE_MAPPING = {
+    "none": 0,
+    "some": 1,
+    "often": 2,
+}
+
+PETS_MAPPING = {"yes": True, "no": False}
+
+# numeric columns kept as float64 arrays, NaN where the value is missing or invalid
+NUMERIC_COLUMNS = (
+    "gpa",
+    "adjusted_age",
+    "applying_to_grade",
+    "current_grade",
+    "english_score",
+    "religious_frequency",
+)
+
+
+def _to_number(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+# every StudentIndex gets the next number, caches use it to tell corpora apart
+_generations = itertools.count(1)
+
+# FullStudent attributes students can be looked up by, see StudentIndex.lookup
+ID_KEYS = ("app_id", "pax_id")
+
+# predicates that scan column data only look at the rows still matching once
+# those are at most this fraction of the corpus, rather than at every row
+NARROW_FRACTION = 1 / 32
+
+# ids sampled per corpus to estimate how selective a usahsId substring is
+USAHSID_SAMPLE = 1000
+
+# FullStudent attributes /students/search can order by
+ORDER_KEYS = ("first_name", "id", "country", "gpa", "adjusted_age", "placement_status")
+
+
+def iter_bits(mask: int) -> Iterator[int]:
+    # bin() runs in C, so scanning its reversed string for "1"s is much faster
+    # than shifting the int bit by bit for large masks
+    bits = bin(mask)[:1:-1]
+    i = bits.find("1")
+    while i != -1:
+        yield i
+        i = bits.find("1", i + 1)
+
+
+def bits_from_mask(mask: np.ndarray) -> int:
+    """Bitset int from a boolean array, bit i set where mask[i] is True."""
+    return int.from_bytes(np.packbits(mask, bitorder="little").tobytes(), "little")
+
+
+def bits_from_positions(positions: Iterable[int], size: int) -> int:
+    member = np.zeros(size, dtype=bool)
+    member[np.fromiter(positions, dtype=np.int64)] = True
+    return bits_from_mask(member)
+
+
+class StudentIndex:
+    """Columnar bitset index over a list of students.
+
+    Every categorical attribute used by SearchFilters gets one bitset per value
+    (a python int where bit i is set if STUDENTS[i] has that value), so
+    structured filters become a handful of AND/OR operations.
+    """
+
+    def __init__(self, students: StudentStore) -> None:
+        self.generation: int = next(_generations)
+        self.students: StudentStore = students
+        self.size: int = len(students)
+        self.all: int = (1 << self.size) - 1
+
+        self.placement_status: dict[str, int] = defaultdict(int)
+        self.gender: dict[str, int] = defaultdict(int)
+        self.state: dict[str, int] = defaultdict(int)
+        self.interest: dict[str, int] = defaultdict(int)
+        self.live_with_pets: dict[Optional[bool], int] = defaultdict(int)
+        self.country: dict[str, int] = defaultdict(int)
+        self.program_type: dict[str, int] = defaultdict(int)
+        self.religious_frequency: dict[int, int] = defaultdict(int)
+        self.grant_prefix: dict[str, int] = defaultdict(int)
+        self.single_placement: int = 0
+        self.double_placement: int = 0
+        self.early_placement: int = 0
+        self.has_video: int = 0
+        # first spelling seen for each lowercased value, for displaying facets
+        self.labels: dict[str, dict[str, str]] = defaultdict(dict)
+
+        usahsids: list[str] = []
+        col = students.column
+        rows = zip(
+            col("placement_status"),
+            col("gender_desc"),
+            col("states"),
+            col("selected_interests"),
+            col("live_with_pets"),
+            col("country"),
+            col("program_type"),
+            col("religious_frequency"),
+            col("usahsid"),
+            col("media_link"),
+        )
+        for i, (
+            status,
+            gender,
+            states,
+            interests,
+            pets,
+            country,
+            program_type,
+            religious_frequency,
+            usahsid,
+            media_link,
+        ) in enumerate(rows):
+            bit = 1 << i
+            self.placement_status[status.lower()] |= bit
+            self.labels["placement_status"].setdefault(status.lower(), status)
+            self.gender[gender.lower()] |= bit
+            self.labels["gender"].setdefault(gender.lower(), gender)
+            for st in states:
+                self.state[st.lower()] |= bit
+                self.labels["state"].setdefault(st.lower(), st)
+            for interest in interests:
+                self.interest[interest] |= bit
+            self.live_with_pets[pets] |= bit
+            self.country[country.lower()] |= bit
+            self.labels["country"].setdefault(country.lower(), country)
+            self.program_type[program_type] |= bit
+            self.religious_frequency[religious_frequency] |= bit
+            self.grant_prefix[usahsid.lower()[0:3]] |= bit
+            if "EP" in usahsid.upper():
+                self.early_placement |= bit
+            if media_link != "":
+                self.has_video |= bit
+            usahsids.append(usahsid.lower())
+        # the store already keeps these flags as little endian bitmasks
+        self.single_placement = int.from_bytes(
+            students.arrays["single_placement"].tobytes(), "little"
+        )
+        self.double_placement = int.from_bytes(
+            students.arrays["double_placement"].tobytes(), "little"
+        )
+
+        # usahsId is a substring search, so keep every id in one newline separated
+        # string and let str.find do the scanning
+        self._usahsid_blob: str = "\n".join(usahsids)
+        self._usahsid_starts: list[int] = []
+        offset = 0
+        for u in usahsids:
+            self._usahsid_starts.append(offset)
+            offset += len(u) + 1
+        self._usahsid_sample: list[str] = usahsids[:: max(1, self.size // USAHSID_SAMPLE)]
+
+        self.numeric: dict[str, np.ndarray] = {
+            column: np.array([_to_number(v) for v in col(column)], dtype=np.float64)
+            for column in NUMERIC_COLUMNS
+        }
+        # an adjusted age of 0 means it was never filled in
+        self.numeric["adjusted_age"][self.numeric["adjusted_age"] == 0] = math.nan
+        # valid values only, sorted, to estimate range selectivity with a bisect
+        self.numeric_sorted: dict[str, np.ndarray] = {
+            column: np.sort(values[~np.isnan(values)])
+            for column, values in self.numeric.items()
+        }
+
+        # per value cardinalities for the query planner
+        self.stats: dict[str, Any] = {
+            column: {v: b.bit_count() for v, b in getattr(self, column).items()}
+            for column in (
+                "placement_status",
+                "gender",
+                "state",
+                "interest",
+                "live_with_pets",
+                "country",
+                "program_type",
+                "religious_frequency",
+                "grant_prefix",
+            )
+        }
+        for flag in ("single_placement", "double_placement", "early_placement", "has_video"):
+            self.stats[flag] = getattr(self, flag).bit_count()
+
+        # positions presorted on every order key in both directions. Descending is
+        # sorted separately rather than reversed so ties keep corpus order, the
+        # same as sorted(..., reverse=True)
+        self.order: dict[tuple[str, bool], np.ndarray] = {
+            (key, descending): np.array(
+                sorted(range(self.size), key=values.__getitem__, reverse=descending),
+                dtype=np.int32,
+            )
+            for key, values in ((key, col(key)) for key in ORDER_KEYS)
+            for descending in (False, True)
+        }
+        # inverse permutations, rank[(key, descending)][position] is where a student
+        # sorts. Ranks order the same way as positions in self.order, so a sorted
+        # rank array is a compact sorted result that a cursor can bisect into
+        self.rank: dict[tuple[str, bool], np.ndarray] = {}
+        for key, order in self.order.items():
+            rank = np.empty(self.size, dtype=np.int32)
+            rank[order] = np.arange(self.size, dtype=np.int32)
+            self.rank[key] = rank
+
+        # id -> position hash indexes for detail pages and favorites. The first
+        # student with an id wins, like the linear scans they replace
+        self.by_id: dict[str, dict[int, int]] = {}
+        for key in ID_KEYS:
+            positions: dict[int, int] = {}
+            for i, value in enumerate(col(key)):
+                positions.setdefault(value, i)
+            self.by_id[key] = positions
+
+        self.text: TextStore = TextStore(students)
+
+    def lookup(self, key: str, value: Any) -> Optional[int]:
+        """Position of the student whose `key` (one of ID_KEYS) is value, None if unknown.
+
+        Accepts the id as an int or a numeric string, favorites store them as strings.
+        """
+        try:
+            return self.by_id[key].get(int(value))
+        except (TypeError, ValueError):
+            return None
+
+    def lookup_many(self, key: str, values: Iterable[Any]) -> list[Optional[int]]:
+        """lookup() for every value, in the same order."""
+        return [self.lookup(key, value) for value in values]
+
+    def sorted_positions(
+        self, positions: list[int], order_by: str, descending: bool
+    ) -> np.ndarray:
+        """`positions` in order_by order, by filtering the presorted permutation."""
+        order = self.order[(order_by, descending)]
+        if len(positions) == self.size:
+            return order
+        member = np.zeros(self.size, dtype=bool)
+        member[positions] = True
+        return order[member[order]]
+
+    def sorted_ranks(self, positions: np.ndarray, order_by: str, descending: bool) -> np.ndarray:
+        """Ranks of `positions` in order_by order, ascending. order[ranks] are the positions."""
+        return np.sort(self.rank[(order_by, descending)][positions])
+
+    @staticmethod
+    def _union(bitsets: Iterable[int]) -> int:
+        mask = 0
+        for b in bitsets:
+            mask |= b
+        return mask
+
+    def _narrow(self, within: int) -> Optional[np.ndarray]:
+        """Positions set in `within` when few enough to scan them alone, else None."""
+        if within.bit_count() > NARROW_FRACTION * self.size:
+            return None
+        return np.fromiter(iter_bits(within), dtype=np.int64)
+
+    def _usahsid(self, i: int) -> str:
+        end = self._usahsid_starts[i + 1] - 1 if i + 1 < self.size else len(self._usahsid_blob)
+        return self._usahsid_blob[self._usahsid_starts[i] : end]
+
+    def _usahsid_containing(self, text: str, within: int) -> int:
+        text = text.lower()
+        if "\n" in text:
+            return 0
+        narrow = self._narrow(within)
+        if narrow is not None:
+            return bits_from_positions(
+                (i for i in narrow.tolist() if text in self._usahsid(i)), self.size
+            )
+        mask = 0
+        pos = self._usahsid_blob.find(text)
+        while pos != -1:
+            i = bisect_right(self._usahsid_starts, pos) - 1
+            mask |= 1 << i
+            # skip to the next id, one hit per student is enough
+            next_start = (
+                self._usahsid_starts[i + 1]
+                if i + 1 < self.size
+                else len(self._usahsid_blob)
+            )
+            pos = self._usahsid_blob.find(text, next_start)
+        return within & mask
+
+    def _values(self, column: str, values: Iterable[Any], name: str) -> "Predicate":
+        values = list(values)
+        bitsets = getattr(self, column)
+        return Predicate(
+            name=name,
+            estimate=sum(self.stats[column].get(v, 0) for v in values),
+            cost=0,
+            bitset=lambda within: within & self._union(bitsets.get(v, 0) for v in values),
+        )
+
+    def _flag(self, column: str, wanted: bool, name: str) -> "Predicate":
+        bitset: int = getattr(self, column)
+        count = self.stats[column]
+        if wanted:
+            return Predicate(
+                name=name, estimate=count, cost=0, bitset=lambda within: within & bitset
+            )
+        return Predicate(
+            name=name,
+            estimate=self.size - count,
+            cost=0,
+            bitset=lambda within: within & ~bitset,
+        )
+
+    def _range(
+        self, column: str, low: Optional[float], high: Optional[float], name: str
+    ) -> "Predicate":
+        values = self.numeric[column]
+        ordered = self.numeric_sorted[column]
+        start = 0 if low is None else int(np.searchsorted(ordered, low, side="left"))
+        stop = len(ordered) if high is None else int(np.searchsorted(ordered, high, side="right"))
+
+        def matches(v: np.ndarray) -> np.ndarray:
+            # NaN compares False either way, so missing values never match
+            mask = ~np.isnan(v)
+            if low is not None:
+                mask &= v >= low
+            if high is not None:
+                mask &= v <= high
+            return mask
+
+        def bitset(within: int) -> int:
+            narrow = self._narrow(within)
+            if narrow is not None:
+                return bits_from_positions(narrow[matches(values[narrow])], self.size)
+            return within & bits_from_mask(matches(values))
+
+        return Predicate(name=name, estimate=max(stop - start, 0), cost=0, bitset=bitset)
+
+    def predicates(self, filters: SearchFilters) -> list["Predicate"]:
+        """One predicate per active structured (non fuzzy) filter, unordered."""
+        preds: list[Predicate] = []
+
+        if filters.statusOptions is not None and "All" not in filters.statusOptions:
+            lower_options = [x.lower() for x in filters.statusOptions]
+            preds.append(
+                self._values(
+                    "placement_status",
+                    (
+                        status
+                        for status in self.placement_status
+                        if any(opt in status for opt in lower_options)
+                    ),
+                    "statusOptions",
+                )
+            )
+
+        if filters.gender_female is not None and filters.gender_male is not None:
+            if filters.gender_female is True and filters.gender_male is True:
+                pass
+            elif filters.gender_female is True:
+                preds.append(self._values("gender", ["female"], "gender"))
+            elif filters.gender_male is True:
+                preds.append(self._values("gender", ["male"], "gender"))
+
+        if filters.state and filters.state != "all":
+            preds.append(self._values("state", [filters.state.lower()], "state"))
+
+        if filters.interests and filters.interests.lower() != "all":
+            preds.append(self._values("interest", [filters.interests], "interests"))
+
+        if filters.gpa and filters.gpa != "all":
+            try:
+                preds.append(self._range("gpa", float(filters.gpa), None, "gpa"))
+            except ValueError:
+                pass
+
+        if filters.pets_in_home is not None and isinstance(filters.pets_in_home, str):
+            if filters.pets_in_home != "all":
+                preds.append(
+                    self._values(
+                        "live_with_pets",
+                        [PETS_MAPPING.get(filters.pets_in_home)],
+                        "pets_in_home",
+                    )
+                )
+
+        if filters.usahsId:
+            usahs_id = filters.usahsId
+            # no statistics for substrings, so estimate from a sample of the ids
+            sample = self._usahsid_sample
+            hits = sum(usahs_id.lower() in u for u in sample)
+            preds.append(
+                Predicate(
+                    name="usahsId",
+                    estimate=hits * self.size // max(len(sample), 1),
+                    cost=1,
+                    bitset=lambda within: self._usahsid_containing(usahs_id, within),
+                )
+            )
+
+        if filters.country_of_origin and filters.country_of_origin != "all":
+            preds.append(
+                self._values(
+                    "country", [filters.country_of_origin.lower()], "country_of_origin"
+                )
+            )
+
+        if filters.adjusted_age and filters.adjusted_age != "all":
+            try:
+                preds.append(
+                    self._range(
+                        "adjusted_age", int(filters.adjusted_age), None, "adjusted_age"
+                    )
+                )
+            except ValueError:
+                pass  # Ignore invalid age filter
+
+        if filters.single_placement is not None and filters.single_placement != "all":
+            if filters.single_placement.lower() == "yes":
+                preds.append(self._flag("single_placement", True, "single_placement"))
+            elif filters.single_placement.lower() == "no":
+                preds.append(self._flag("single_placement", False, "single_placement"))
+
+        if filters.double_placement is not None and filters.double_placement != "all":
+            if filters.double_placement.lower() == "yes":
+                preds.append(self._flag("double_placement", True, "double_placement"))
+            elif filters.double_placement.lower() == "no":
+                preds.append(self._flag("double_placement", False, "double_placement"))
+
+        if filters.program_types is not None and len(filters.program_types) != 0:
+            p_types = [PROGRAM_TYPE_MAPPING[x] for x in filters.program_types]
+            preds.append(
+                self._values(
+                    "program_type",
+                    (
+                        program_type
+                        for program_type in self.program_type
+                        if any(x in program_type for x in p_types)
+                    ),
+                    "program_types",
+                )
+            )
+
+        if filters.early_placement is not None and filters.early_placement != "all":
+            preds.append(
+                self._flag(
+                    "early_placement",
+                    filters.early_placement.lower() == "yes",
+                    "early_placement",
+                )
+            )
+
+        if filters.hasVideo is not None and filters.hasVideo is True:
+            preds.append(self._flag("has_video", True, "hasVideo"))
+
+        if filters.religiousPractice is not None and filters.religiousPractice != "all":
+            preds.append(
+                self._values(
+                    "religious_frequency",
+                    [RELIGIOUS_PRACTICE_MAPPING[filters.religiousPractice]],
+                    "religiousPractice",
+                )
+            )
+
+        if filters.grants_options is not None and len(filters.grants_options) != 0:
+            if "grant" in filters.grants_options:
+                prefixes = [x.lower() for x in GRANT_PREFIXES]
+            else:
+                prefixes = list(filters.grants_options)
+            preds.append(self._values("grant_prefix", prefixes, "grants_options"))
+
+        for column in NUMERIC_COLUMNS:
+            low = getattr(filters, f"{column}_min")
+            high = getattr(filters, f"{column}_max")
+            if low is not None or high is not None:
+                preds.append(self._range(column, low, high, f"{column}_range"))
+
+        return preds
+
+
+class Predicate(NamedTuple):
+    name: str
+    # expected number of matching students, from the index statistics
+    estimate: int
+    # 0 for plain bitset lookups, higher for predicates that scan data
+    cost: int
+    # the students among `within` (a bitset) that match. Predicates that scan
+    # data only look at those once few are left, see NARROW_FRACTION
+    bitset: Callable[[int], int]
@@ -0,0 +1,257 @@
+from typing import Any, Callable, Iterator, Optional, Protocol, cast
+
+import numpy as np
+
+from models.student import FullStudent
+
+_NONE = 0xFFFFFFFF  # string id of None
+
+_KINDS: dict[Any, str] = {
+    int: "int",
+    bool: "bool",
+    Optional[bool]: "bool",
+    str: "str",
+    Optional[str]: "str",
+    list[str]: "list",
+    set[str]: "set",
+}
+# (FullStudent field, how StudentStore keeps it)
+SCHEMA: list[tuple[str, str]] = [
+    (name, _KINDS[field.annotation]) for name, field in FullStudent.model_fields.items()
+]
+
+
+class StudentFields(Protocol):
+    """The FullStudent attributes, for code that reads them from either a
+    FullStudent or a StudentView."""
+
+    first_name: str
+    app_id: int
+    pax_id: int
+    country: str
+    gpa: str
+    english_score: str
+    applying_to_grade: int
+    usahsid: str
+    program_type: str
+    adjusted_age: int
+    selected_interests: list[str]
+    urban_request: str
+    placement_status: str
+    gender_desc: str
+    id: int
+    current_grade: int
+    status: str
+    states: set[str]
+    early_placement: Optional[bool]
+    single_placement: bool
+    double_placement: bool
+    free_text_interests: list[str]
+    family_description: str
+    favorite_subjects: str
+    photo_comments: str
+    religion: str
+    allergy_comments: str
+    dietary_restrictions: str
+    religious_frequency: int
+    intro_message: str
+    message_to_host_family: str
+    message_from_natural_family: str
+    media_link: str
+    health_comments: list[str]
+    live_with_pets: Optional[bool]
+    local_coordinator: Optional[str]
+
+
+class _Strings:
+    def __init__(self) -> None:
+        self.ids: dict[str, int] = {}
+
+    def id(self, value: Optional[str]) -> int:
+        if value is None:
+            return _NONE
+        return self.ids.setdefault(value, len(self.ids))
+
+
+def pack_bytes(values: list[bytes]) -> tuple[np.ndarray, np.ndarray]:
+    """Many byte strings as one uint8 buffer and int64 offsets, value i being
+    buffer[offsets[i] : offsets[i + 1]]. The layout of every variable length
+    column, so they can all go in the snapshot as plain arrays."""
+    offsets = np.cumsum([0] + [len(v) for v in values], dtype=np.int64)
+    return np.frombuffer(b"".join(values), dtype=np.uint8), offsets
+
+
+def _bits(values: list[bool]) -> np.ndarray:
+    return np.packbits(np.array(values, dtype=bool), bitorder="little")
+
+
+class StudentStore:
+    """The student corpus as columns, one entry per FullStudent field.
+
+    int fields are int64 arrays, booleans are packed bitmasks (with a second
+    mask marking None for the Optional ones), and every string, including the
+    elements of list and set fields, is a uint32 id into one table holding each
+    distinct string once. A list field is an offsets array into a flat id array.
+    The string table is a single UTF-8 buffer (the mmapped snapshot when loaded
+    from one, shared between worker processes) decoded on access.
+
+    store[i] is a StudentView that reads fields on attribute access (iterating
+    gives the same views, typed as StudentFields), and
+    store.model(i) builds the pydantic model, which should only be needed when
+    a response is serialized.
+    """
+
+    def __init__(
+        self,
+        arrays: dict[str, np.ndarray],
+        blob: memoryview,
+        string_offsets: np.ndarray,
+        fields_set: set[str],
+        derived: Optional[dict[str, np.ndarray]] = None,
+    ) -> None:
+        # named like the snapshot columns: "<field>", "<field>.nulls" for optional
+        # booleans and "<field>.offsets" + "<field>.ids" for list fields
+        self.arrays: dict[str, np.ndarray] = arrays
+        # string i is blob[string_offsets[i] : string_offsets[i + 1]]
+        self.blob: memoryview = blob
+        self.string_offsets: np.ndarray = string_offsets
+        # fields the parsed models had explicitly set, so model(i) compares equal to them
+        self.fields_set: set[str] = fields_set
+        # arrays other modules compute from the columns (the n-gram index of
+        # utils.text_search), kept here so the snapshot stores them alongside
+        self.derived: dict[str, np.ndarray] = derived if derived is not None else {}
+        self.size: int = len(arrays["app_id"])
+        self._getters: dict[str, Callable[[int], Any]] = {
+            name: self._getter(name, kind) for name, kind in SCHEMA
+        }
+
+    @classmethod
+    def from_models(cls, students: list[FullStudent]) -> "StudentStore":
+        strings = _Strings()
+        arrays: dict[str, np.ndarray] = {}
+        for name, kind in SCHEMA:
+            values = [getattr(s, name) for s in students]
+            if kind == "int":
+                arrays[name] = np.array(values, dtype=np.int64)
+            elif kind == "bool":
+                arrays[name] = _bits([v is True for v in values])
+                arrays[f"{name}.nulls"] = _bits([v is None for v in values])
+            elif kind == "str":
+                arrays[name] = np.array([strings.id(v) for v in values], dtype=np.uint32)
+            else:
+                # sets are stored sorted so the same corpus always gives the same arrays
+                items = [sorted(v) if kind == "set" else v for v in values]
+                arrays[f"{name}.offsets"] = np.cumsum(
+                    [0] + [len(v) for v in items], dtype=np.int64
+                )
+                arrays[f"{name}.ids"] = np.array(
+                    [strings.id(x) for v in items for x in v], dtype=np.uint32
+                )
+        fields_set = set(students[0].model_fields_set) if students else set()
+        encoded = [s.encode() for s in strings.ids]
+        offsets = np.cumsum([0] + [len(b) for b in encoded], dtype=np.int64)
+        return cls(arrays, memoryview(b"".join(encoded)), offsets, fields_set)
+
+    def string(self, string_id: int) -> Optional[str]:
+        if string_id == _NONE:
+            return None
+        offsets = self.string_offsets
+        return str(self.blob[offsets[string_id] : offsets[string_id + 1]], "utf-8")
+
+    def strings(self, string_ids: np.ndarray) -> list[Optional[str]]:
+        """Decode many ids at once, for bulk column reads."""
+        blob = self.blob
+        present = string_ids != _NONE
+        ids = np.where(present, string_ids, 0).astype(np.intp)
+        starts = self.string_offsets[ids].tolist()
+        ends = self.string_offsets[ids + 1].tolist()
+        return [
+            str(blob[a:b], "utf-8") if p else None
+            for a, b, p in zip(starts, ends, present.tolist())
+        ]
+
+    def _getter(self, name: str, kind: str) -> Callable[[int], Any]:
+        string = self.string
+        if kind == "int":
+            ints = self.arrays[name]
+            return lambda i: int(ints[i])
+        if kind == "bool":
+            bits, nulls = self.arrays[name], self.arrays[f"{name}.nulls"]
+            return lambda i: (
+                None if nulls[i >> 3] >> (i & 7) & 1 else bool(bits[i >> 3] >> (i & 7) & 1)
+            )
+        if kind == "str":
+            codes = self.arrays[name]
+            return lambda i: string(int(codes[i]))
+        offsets, ids = self.arrays[f"{name}.offsets"], self.arrays[f"{name}.ids"]
+        container = set if kind == "set" else list
+        return lambda i: container(self.strings(ids[offsets[i] : offsets[i + 1]]))
+
+    def column(self, name: str) -> list:
+        """Every student's value of one field, decoded in bulk."""
+        kind = dict(SCHEMA)[name]
+        if kind == "int":
+            return self.arrays[name].tolist()
+        if kind == "bool":
+            bits = np.unpackbits(self.arrays[name], count=self.size, bitorder="little")
+            nulls = np.unpackbits(self.arrays[f"{name}.nulls"], count=self.size, bitorder="little")
+            return [None if n else bool(b) for b, n in zip(bits.tolist(), nulls.tolist())]
+        if kind == "str":
+            return self.strings(self.arrays[name])
+        offsets = self.arrays[f"{name}.offsets"].tolist()
+        ids = self.strings(self.arrays[f"{name}.ids"])
+        container = set if kind == "set" else list
+        return [container(ids[offsets[i] : offsets[i + 1]]) for i in range(self.size)]
+
+    def get(self, name: str, i: int) -> Any:
+        return self._getters[name](i)
+
+    def model(self, i: int) -> FullStudent:
+        return FullStudent.model_construct(
+            _fields_set=set(self.fields_set),
+            **{name: get(i) for name, get in self._getters.items()},
+        )
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes of every array, the derived ones included. Loaded from a snapshot
+        these are file pages shared between workers, not heap of each one."""
+        return (
+            sum(a.nbytes for a in self.arrays.values())
+            + self.string_offsets.nbytes
+            + self.blob.nbytes
+            + sum(a.nbytes for a in self.derived.values())
+        )
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, i: int) -> "StudentView":
+        if not -self.size <= i < self.size:
+            raise IndexError(i)
+        return StudentView(self, i % self.size if self.size else i)
+
+    def __iter__(self) -> Iterator[StudentFields]:
+        # a StudentView has the fields through __getattr__, which type checkers
+        # don't match against the protocol
+        return (cast(StudentFields, StudentView(self, i)) for i in range(self.size))
+
+
+class StudentView:
+    """One student of a StudentStore, with the FullStudent attributes read on access."""
+
+    __slots__ = ("store", "position")
+
+    def __init__(self, store: StudentStore, position: int) -> None:
+        self.store: StudentStore = store
+        self.position: int = position
+
+    def __getattr__(self, name: str) -> Any:
+        try:
+            get = self.store._getters[name]
+        except KeyError:
+            raise AttributeError(name) from None
+        return get(self.position)
+
+    def model(self) -> FullStudent:
+        return self.store.model(self.position)
@@ -0,0 +1,341 @@
+import math
+import os
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+import numpy as np
+from rapidfuzz import fuzz, process, utils
+
+from utils.student_store import StudentFields, StudentStore, pack_bytes
+
+# threads fuzzy scoring is split across. cdist releases the GIL while scoring,
+# so shards of one query and concurrent queries all run on separate cores
+SEARCH_WORKERS: int = int(os.getenv("search_workers", str(os.cpu_count() or 1)))
+
+# below this many rows per shard the thread handoff costs more than it saves
+MIN_SHARD_ROWS = 512
+
+_SHARD_POOL: Optional[ThreadPoolExecutor] = None
+_shard_pool_lock = threading.Lock()
+
+
+def _shard_pool() -> ThreadPoolExecutor:
+    global _SHARD_POOL
+    with _shard_pool_lock:
+        if _SHARD_POOL is None:
+            _SHARD_POOL = ThreadPoolExecutor(
+                max_workers=SEARCH_WORKERS, thread_name_prefix="text-search"
+            )
+        return _SHARD_POOL
+
+PHOTO_SEARCH_CUTOFF = 86
+
+NGRAM_SIZE = 3
+
+# (column name, how to pull the text out of a student, scorer, minimum score)
+FREE_TEXT_FIELDS: list[tuple[str, Callable[[StudentFields], str], Callable, int]] = [
+    ("first_name", lambda s: s.first_name, fuzz.ratio, 86),
+    ("photo_comments", lambda s: s.photo_comments, fuzz.partial_ratio, 86),
+    ("religion", lambda s: s.religion, fuzz.ratio, 86),
+    ("allergy_comments", lambda s: s.allergy_comments, fuzz.partial_ratio, 86),
+    ("dietary_restrictions", lambda s: s.dietary_restrictions, fuzz.partial_ratio, 86),
+    ("health_comments", lambda s: " ".join(s.health_comments), fuzz.partial_ratio, 86),
+    ("favorite_subjects", lambda s: s.favorite_subjects, fuzz.partial_ratio, 86),
+    ("selected_interests", lambda s: " ".join(s.selected_interests), fuzz.partial_ratio, 86),
+    ("free_text_interests", lambda s: " ".join(s.free_text_interests), fuzz.partial_ratio, 80),
+    ("intro_message", lambda s: s.intro_message, fuzz.partial_ratio, 86),
+    ("message_to_host_family", lambda s: s.message_to_host_family, fuzz.partial_ratio, 86),
+    ("message_from_natural_family", lambda s: s.message_from_natural_family, fuzz.partial_ratio, 86),
+]
+
+
+def min_shared_ngrams(query_len: int, cutoff: int, n: int = NGRAM_SIZE) -> int:
+    """Lower bound on the query n-grams a text must contain to reach cutoff with
+    fuzz.partial_ratio, for texts longer than the query.
+
+    partial_ratio is the best fuzz.ratio between the query (length m) and a window
+    of the text (length i <= m, shorter only at the text edges). Reaching the
+    cutoff needs an LCS >= r * (m + i) / 2, every query char outside the LCS
+    destroys at most n query n-grams and every window char outside it at most
+    n - 1, and whatever n-grams survive appear verbatim in the text.
+    """
+    if query_len < n:
+        return 0
+    r = cutoff / 100
+    smallest_window = r * query_len / (2 - r)
+    destroyed = max(
+        n * query_len + (n - 1) * i - (2 * n - 1) * r * (query_len + i) / 2
+        for i in (smallest_window, query_len)
+    )
+    # small slack so float rounding can never prune a real match
+    return math.ceil(query_len - n + 1 - destroyed - 1e-6)
+
+
+# lookup tables up to this many entries replace sorting in NGramIndex.build
+_TABLE_LIMIT = 1 << 26
+
+# bits per code point in a packed n-gram, so NGRAM_SIZE can be at most 3
+_CODE_POINT_BITS = 21
+
+
+def _distinct(values: np.ndarray) -> np.ndarray:
+    """np.unique for non negative ints, marking a table instead of sorting when it fits."""
+    if len(values) == 0 or int(values.max()) >= _TABLE_LIMIT:
+        return np.unique(values)
+    seen = np.zeros(int(values.max()) + 1, dtype=bool)
+    seen[values] = True
+    return np.flatnonzero(seen)
+
+
+def _dense_ids(values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """(sorted distinct values, index of every value in them), np.unique(return_inverse=True)."""
+    distinct = _distinct(values)
+    if len(distinct) == 0 or int(distinct[-1]) >= _TABLE_LIMIT:
+        return distinct, np.searchsorted(distinct, values)
+    lookup = np.zeros(int(distinct[-1]) + 1, dtype=np.int64)
+    lookup[distinct] = np.arange(len(distinct))
+    return distinct, lookup[values]
+
+
+def _pack(gram: str) -> int:
+    key = 0
+    for char in gram:
+        key = key << _CODE_POINT_BITS | ord(char)
+    return key
+
+
+class NGramIndex:
+    """Inverted index from n-gram to the rows of a text column containing it.
+
+    Kept as flat arrays so it can be stored in the corpus snapshot: `grams` is
+    every n-gram in the column, sorted, with its code points packed into one
+    uint64 (see _pack), and the rows containing grams[i] are
+    rows[offsets[i] : offsets[i + 1]], ascending.
+    """
+
+    def __init__(
+        self,
+        grams: np.ndarray,
+        offsets: np.ndarray,
+        rows: np.ndarray,
+        lengths: np.ndarray,
+        n: int = NGRAM_SIZE,
+    ) -> None:
+        self.n: int = n
+        self.grams: np.ndarray = grams
+        self.offsets: np.ndarray = offsets
+        self.rows: np.ndarray = rows
+        # length of every row's text
+        self.lengths: np.ndarray = lengths
+        self.size: int = len(lengths)
+
+    @classmethod
+    def build(cls, values: list[str], n: int = NGRAM_SIZE) -> "NGramIndex":
+        """Index a column with array operations over all of its text at once."""
+        if n * _CODE_POINT_BITS > 64:
+            raise ValueError(f"{n}-grams don't fit in a uint64")
+        lengths = np.fromiter(map(len, values), dtype=np.int32, count=len(values))
+        ends = np.cumsum(lengths, dtype=np.int64)
+        code_points = np.frombuffer("".join(values).encode("utf-32-le"), dtype=np.uint32)
+
+        # every n-gram as a number, from the characters renumbered 0..A-1
+        alphabet, chars = _dense_ids(code_points)
+        size = max(len(code_points) - n + 1, 0)
+        ids = np.zeros(size, dtype=np.int64)
+        for k in range(n):
+            ids = ids * len(alphabet) + chars[k : k + size]
+        row_of = np.repeat(np.arange(len(values), dtype=np.int64), lengths)[:size]
+        # drop the ones running over the end of their row into the next
+        inside = np.arange(size) + n <= ends[row_of] if size else np.zeros(0, dtype=bool)
+        ids, row_of = ids[inside], row_of[inside]
+
+        # each (n-gram, row) pair once, ordered by n-gram and then row
+        gram_ids, gram_of = _dense_ids(ids)
+        pairs = _distinct(gram_of * len(values) + row_of)
+        pair_grams, rows = np.divmod(pairs, max(len(values), 1))
+        offsets = np.searchsorted(pair_grams, np.arange(len(gram_ids) + 1)).astype(np.int64)
+
+        # the n-gram numbers are in code point order, so the packed keys stay sorted
+        grams = np.zeros(len(gram_ids), dtype=np.uint64)
+        rest = gram_ids
+        for k in range(n):
+            rest, char = np.divmod(rest, len(alphabet))
+            grams |= alphabet[char].astype(np.uint64) << np.uint64(k * _CODE_POINT_BITS)
+        return cls(grams, offsets, rows.astype(np.int32), lengths, n)
+
+    def arrays(self, prefix: str) -> dict[str, np.ndarray]:
+        return {
+            f"{prefix}.grams": self.grams,
+            f"{prefix}.offsets": self.offsets,
+            f"{prefix}.rows": self.rows,
+            f"{prefix}.lengths": self.lengths,
+        }
+
+    @classmethod
+    def from_arrays(
+        cls, arrays: dict[str, np.ndarray], prefix: str, n: int = NGRAM_SIZE
+    ) -> Optional["NGramIndex"]:
+        """The index saved with arrays(prefix), None when it isn't there."""
+        try:
+            return cls(
+                arrays[f"{prefix}.grams"],
+                arrays[f"{prefix}.offsets"],
+                arrays[f"{prefix}.rows"],
+                arrays[f"{prefix}.lengths"],
+                n,
+            )
+        except KeyError:
+            return None
+
+    def candidates(self, query: str, cutoff: int) -> Optional[np.ndarray]:
+        """Boolean mask of rows that may reach cutoff, or None if nothing can be pruned."""
+        needed = min_shared_ngrams(len(query), cutoff, self.n)
+        if needed <= 0:
+            return None
+        counts = np.zeros(self.size, dtype=np.int32)
+        grams = Counter(query[i : i + self.n] for i in range(len(query) - self.n + 1))
+        for gram, count in grams.items():
+            key = np.uint64(_pack(gram))
+            i = int(np.searchsorted(self.grams, key))
+            if i < len(self.grams) and self.grams[i] == key:
+                counts[self.rows[self.offsets[i] : self.offsets[i + 1]]] += count
+        # texts no longer than the query are aligned the other way round by
+        # partial_ratio, so the bound does not hold for them
+        return (counts >= needed) | (self.lengths <= len(query))
+
+
+# short ratio() fields (names, religion) are cheap enough to always score
+NGRAM_FIELDS: list[str] = [
+    name for name, _, scorer, _ in FREE_TEXT_FIELDS if scorer is fuzz.partial_ratio
+]
+
+
+class TextColumn:
+    """A processed text column as one UTF-8 buffer (see pack_bytes), rows are
+    decoded only when they are scored."""
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray) -> None:
+        self.blob: memoryview = blob.data
+        self.offsets: np.ndarray = offsets
+
+    @classmethod
+    def from_strings(cls, values: list[str]) -> "TextColumn":
+        return cls(*pack_bytes([v.encode() for v in values]))
+
+    def take(self, rows: np.ndarray) -> list[str]:
+        blob = self.blob
+        starts = self.offsets[rows].tolist()
+        ends = self.offsets[rows + 1].tolist()
+        return [str(blob[a:b], "utf-8") for a, b in zip(starts, ends)]
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+
+def text_index_arrays(students: StudentStore) -> dict[str, np.ndarray]:
+    """The columns and n-gram indexes of TextStore as arrays, for StudentStore.derived."""
+    arrays: dict[str, np.ndarray] = {}
+    for name, extract, _, _ in FREE_TEXT_FIELDS:
+        column = [utils.default_process(extract(s)) for s in students]
+        arrays[f"text.{name}.blob"], arrays[f"text.{name}.offsets"] = pack_bytes(
+            [v.encode() for v in column]
+        )
+        if name in NGRAM_FIELDS:
+            arrays.update(NGramIndex.build(column).arrays(f"ngrams.{name}"))
+    return arrays
+
+
+class TextStore:
+    """Every searchable text field, run through utils.default_process once.
+
+    The processed columns and their n-gram indexes are built with the snapshot
+    (see text_index_arrays) and read straight from it, so they are shared
+    between workers; they are only built here for a store without them.
+    Queries are processed once per request and scored against a whole column
+    with process.cdist instead of one fuzz call per student. Large columns are
+    split into up to `workers` shards scored in parallel on a shared thread pool;
+    the columns are read only, so the threads share them without copies.
+    """
+
+    def __init__(self, students: StudentStore, workers: int = SEARCH_WORKERS) -> None:
+        self.workers: int = workers
+        arrays = students.derived
+        if any(f"text.{name}.offsets" not in arrays for name, _, _, _ in FREE_TEXT_FIELDS):
+            arrays = text_index_arrays(students)
+        self.columns: dict[str, TextColumn] = {
+            name: TextColumn(arrays[f"text.{name}.blob"], arrays[f"text.{name}.offsets"])
+            for name, _, _, _ in FREE_TEXT_FIELDS
+        }
+        self.ngrams: dict[str, NGramIndex] = {}
+        for name in NGRAM_FIELDS:
+            ngrams = NGramIndex.from_arrays(arrays, f"ngrams.{name}")
+            if ngrams is None:
+                ngrams = NGramIndex.build(self.columns[name].take(np.arange(len(students))))
+            self.ngrams[name] = ngrams
+
+    def _score(
+        self, column: str, query: str, positions: list[int], scorer: Callable, cutoff: int
+    ) -> np.ndarray:
+        hits = np.zeros(len(positions), dtype=bool)
+        if column in self.ngrams:
+            candidates = self.ngrams[column].candidates(query, cutoff)
+        else:
+            candidates = None
+        if candidates is None:
+            rows = np.arange(len(positions))
+        else:
+            rows = np.flatnonzero(candidates[positions])
+        if len(rows) == 0:
+            return hits
+
+        values = self.columns[column]
+        position_array = np.asarray(positions, dtype=np.intp)
+
+        def score_shard(shard: np.ndarray) -> np.ndarray:
+            # cdist only parallelizes across queries, and there is one query
+            return process.cdist(
+                [query],
+                values.take(position_array[shard]),
+                scorer=scorer,
+                processor=None,
+                score_cutoff=cutoff,
+                dtype=np.float64,
+                workers=1,
+            )[0]
+
+        shards = min(self.workers, len(rows) // MIN_SHARD_ROWS)
+        if shards <= 1:
+            scores = score_shard(rows)
+        else:
+            scores = np.concatenate(
+                list(_shard_pool().map(score_shard, np.array_split(rows, shards)))
+            )
+        hits[rows] = scores >= cutoff
+        return hits
+
+    def photo_matches(self, query: str, positions: list[int]) -> list[int]:
+        if not positions:
+            return positions
+        hits = self._score(
+            "photo_comments",
+            utils.default_process(query),
+            positions,
+            fuzz.partial_ratio,
+            PHOTO_SEARCH_CUTOFF,
+        )
+        return [p for p, hit in zip(positions, hits) if hit]
+
+    def free_text_matches(self, query: str, positions: list[int]) -> list[int]:
+        """Positions where any free text field scores above its cutoff, in input order."""
+        query = utils.default_process(query)
+        matched: set[int] = set()
+        remaining = positions
+        for name, _, scorer, cutoff in FREE_TEXT_FIELDS:
+            if not remaining:
+                break
+            hits = self._score(name, query, remaining, scorer, cutoff)
+            matched.update(p for p, hit in zip(remaining, hits) if hit)
+            remaining = [p for p, hit in zip(remaining, hits) if not hit]
+        return [p for p in positions if p in matched]
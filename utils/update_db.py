@@ -1,120 +1,247 @@
-import json
-import math
-
-import requests
-
-from utils.beacon_auth import gen_auth_code
-from utils.db import does_student_exist, update_student_status, update_time
-
-
-def first_filter(data=None):
-    data = json.load(open("response_json.json", "r"))
-
-    # if student is already loaded into database then only need to check if status is different
-    # otherwise treat student as not in db yet
+import os
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, Optional
+
+from utils.beacon_client import BeaconClient
+from utils.db import (
+    SOURCE_BEACON,
+    get_sync_state,
+    reconcile_students,
+    set_sync_state,
+    update_time,
+)
+from utils.json_stream import JSONArrayWriter, iter_json_array
+from utils.student_fields import placement_status_label, program_type_label
+
+
+def _stored_responses() -> Iterator[dict]:
+    # streamed, one student in memory at a time
+    with open("response_json.json", "r") as f:
+        yield from iter_json_array(f, key="results")
+
+
+def _simple_student_row(student: dict) -> tuple:
+    # search results only carry a summary of each placement. Values get the same
+    # cleanup as the corpus load (see utils.student_fields) so both syncs agree on
+    # what is stored, and the corpus load fills in the rest when it adopts the row
+    return (
+        student.get("firstName") or "",
+        student.get("applicationId"),
+        student.get("participantId"),
+        student.get("residenceCountry") or "",
+        program_type_label(student.get("productName") or ""),
+        student.get("age") or 0,
+        placement_status_label(student.get("placementStatusName") or ""),
+    )
 
-    for student in data['results']:
-        # Check if student in database
-        student_id, status_in_db = does_student_exist(student.get('applicationId'))
-        if student_id is not None:
-            # if student exists, confirm if the status is the same
-            if student.get('placementStatusName') != status_in_db:
-                # if status was unassigned but now is allocated, need to perform update just to ensure values did not change
-                if status_in_db.lower() == "unassigned":
-                    ...
-                update_student_status(app_id=student_id, placement_status=student.get('placementStatusName'))
 
-        else:
-            ...
+def first_filter(data=None) -> dict:
+    """Reconcile simple_students with the downloaded placements in one transaction.
+
+    `data` is the changed students of an incremental sync, otherwise everything
+    downloaded is compared and students the Beacon sync inserted that are no
+    longer in it are deleted. Rows from the corpus are never deleted here, that
+    is up to db.sync_students. Returns the change summary of db.reconcile_students.
+    """
+    # one query for what the database has, the diff is done in memory and every
+    # change is written with executemany. Existing students only ever get their
+    # placement status updated
+    students = data if data is not None else _stored_responses()
+    summary = reconcile_students(
+        (_simple_student_row(student) for student in students),
+        source=SOURCE_BEACON,
+        delete_missing=data is None,
+    )
 
     update_time()
-
-
-
-def update_responses() -> None:
-    PAGE_SIZE = 100
+    print(f"beacon db sync: {summary}")
+    return summary
+
+
+# a full download replaces incremental syncs at least this often, see sync_from_beacon
+FULL_SYNC_HOURS: float = float(os.getenv("beacon_full_sync_hours", "24"))
+
+# the placements update_responses downloads, Beacon's searchwithcount body
+# without page / pageSize
+PLACEMENT_QUERY = {
+    "statuses": [
+        1,  # Allocated
+        4,  # Placement Pending
+        5,  # Placement - Review Needed
+        6,  # Placed
+        7,  # Placed - Accepted
+        8,  # Placed - Closed
+        10,  # Placed - Updated
+        18,  # unassigned
+    ],
+    "states": [],
+    "products": [
+        223,  # 2025 aug 5  month
+        224,  # 2025 aug 10 month
+        225,  # 2025 jan 10 month
+        226,  # 2025 jan 5  month
+    ],
+    "orderBy": "ModifiedOn",
+    "andBy": "",
+    "ascending": False,
+    "rds": [],
+    "showDeleted": False,
+    "localCoordinators": [],
+    # "availableForPlacement": True,
+    "year": [],
+    "agent": [],
+    "gender": [],
+}
+
+
+# Beacon's fields are camelCase; orderBy in PLACEMENT_QUERY is the sort name, not the key
+MODIFIED_ON = "modifiedOn"
+
+
+def _parse_time(value: object) -> Optional[datetime]:
+    if not isinstance(value, str):
+        return None
+    # .NET sends up to 7 fractional digits, fromisoformat takes at most 6
+    value = re.sub(r"(\.\d{6})\d+", r"\1", value.replace("Z", "+00:00"))
     try:
-        AUTH_TOKEN = open("bearer_token", "r").read()
-    except FileNotFoundError:
-        AUTH_TOKEN = gen_auth_code()
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    # naive times are UTC, so every time compares with every other
+    return parsed if parsed.tzinfo is not None else parsed.replace(tzinfo=timezone.utc)
 
-    if AUTH_TOKEN is None:
-        raise Exception("Unable to authenticate to base system")
 
-    headers = {
-        "Accept": "application/json, text/plain, */*",
-        "Authorization": AUTH_TOKEN,
-    }
+def _modified_on(student: dict) -> Optional[datetime]:
+    """When the placement was last modified, None when it has no parseable modifiedOn."""
+    return _parse_time(student.get(MODIFIED_ON))
 
-    json_data = {
-        "statuses": [
-            1,  # Allocated
-            4,  # Placement Pending
-            5,  # Placement - Review Needed
-            6,  # Placed
-            7,  # Placed - Accepted
-            8,  # Placed - Closed
-            10,  # Placed - Updated
-            18,  # unassigned
-        ],
-        "states": [],
-        "products": [
-            223,  # 2025 aug 5  month
-            224,  # 2025 aug 10 month
-            225,  # 2025 jan 10 month
-            226,  # 2025 jan 5  month
-        ],
-        "orderBy": "ModifiedOn",
-        "andBy": "",
-        "ascending": False,
-        "rds": [],
-        "showDeleted": False,
-        "localCoordinators": [],
-        # "availableForPlacement": True,
-        "year": [],
-        "agent": [],
-        "page": 1,
-        "pageSize": PAGE_SIZE,
-        "gender": [],
-    }
 
-    response = requests.post(
-        "https://api.ciee.org/beacon/Placement/searchwithcount",
-        headers=headers,
-        json=json_data,
-    )
-
-    if response.status_code >= 400:
-        print("Bad authorization, generating new token.")
-        AUTH_TOKEN = gen_auth_code()
-        if AUTH_TOKEN is None:
-            raise Exception("Unable to authenticate with beacon")
-        headers["Authorization"] = AUTH_TOKEN
-        response = requests.post(
-            "https://api.ciee.org/beacon/Placement/searchwithcount",
-            headers=headers,
-            json=json_data,
-        )
+class _Newest:
+    """The newest modifiedOn seen, as Beacon sent it. Records without one are skipped,
+    the watermark is best effort and the next full download sees them anyway."""
 
-    r_json = response.json()
+    def __init__(self) -> None:
+        self.time: Optional[datetime] = None
+        self.value: Optional[str] = None
 
-    data = {"results": []}
-    data["results"].extend(r_json.get("results", []))
+    def see(self, student: dict) -> None:
+        modified = _modified_on(student)
+        if modified is not None and (self.time is None or modified > self.time):
+            self.time, self.value = modified, student[MODIFIED_ON]
 
-    iterations_needed: int = math.ceil(r_json["count"] / PAGE_SIZE)
 
-    for page_num in range(2, iterations_needed + 1):
-        json_data["page"] = page_num
-        response = requests.post(
-            "https://api.ciee.org/beacon/Placement/searchwithcount",
-            headers=headers,
-            json=json_data,
+def update_responses() -> Optional[str]:
+    """Download every placement into response_json.json, returns the newest modifiedOn."""
+    newest = _Newest()
+    # pages are fetched concurrently over pooled connections (see utils.beacon_client)
+    # and appended to the file in page order as they arrive, so only a few are held
+    # in memory. Written beside the old file and swapped in at the end, readers
+    # never see half of it
+    try:
+        with BeaconClient() as beacon, open("response_json.json.tmp", "w") as f:
+            with JSONArrayWriter(f, key="results") as out:
+                for page in beacon.iter_pages(PLACEMENT_QUERY):
+                    for student in page.get("results", []):
+                        out.write(student)
+                        newest.see(student)
+        os.replace("response_json.json.tmp", "response_json.json")
+    finally:
+        # only left behind when the download failed
+        if os.path.exists("response_json.json.tmp"):
+            os.remove("response_json.json.tmp")
+
+    return newest.value
+
+
+def fetch_changes(watermark: str) -> list[dict]:
+    """Placements modified at or after `watermark`, newest first, one per applicationId.
+
+    PLACEMENT_QUERY is ordered by modification time descending, so paging stops
+    at the first page that reaches older records. Records exactly at the
+    watermark are fetched again, another student may have been modified in the
+    same instant. Records without a parseable modifiedOn are left to the next
+    full download.
+    """
+    since = _parse_time(watermark)
+    if since is None:
+        raise ValueError(f"Unparseable Beacon sync watermark: {watermark!r}")
+
+    def reached_watermark(page: dict) -> bool:
+        times = [t for t in map(_modified_on, page.get("results", [])) if t is not None]
+        return not page.get("results") or (bool(times) and min(times) < since)
+
+    changed: dict[int, dict] = {}
+    with BeaconClient() as beacon:
+        for page in beacon.iter_pages(PLACEMENT_QUERY, until=reached_watermark):
+            for student in page.get("results", []):
+                modified = _modified_on(student)
+                if modified is not None and modified >= since:
+                    changed.setdefault(student["applicationId"], student)
+    return list(changed.values())
+
+
+def merge_responses(changed: list[dict]) -> None:
+    """Write the changed placements over their old records in response_json.json."""
+    changed_ids = {student["applicationId"] for student in changed}
+    try:
+        with open("response_json.json.tmp", "w") as f:
+            with JSONArrayWriter(f, key="results") as out:
+                # newest first, like a full download
+                for student in changed:
+                    out.write(student)
+                for student in _stored_responses():
+                    if student.get("applicationId") not in changed_ids:
+                        out.write(student)
+        os.replace("response_json.json.tmp", "response_json.json")
+    finally:
+        # only left behind when the merge failed
+        if os.path.exists("response_json.json.tmp"):
+            os.remove("response_json.json.tmp")
+
+
+def sync_from_beacon(full: Optional[bool] = None) -> dict:
+    """Refresh response_json.json and the database from Beacon.
+
+    Incremental by default: only the placements modified since the last sync's
+    watermark are downloaded and merged. An incremental sync can't see
+    placements that dropped out of PLACEMENT_QUERY, so a full download runs
+    instead when there is no watermark or stored download yet, when the last
+    one is older than $beacon_full_sync_hours, or with full=True.
+    """
+    watermark, last_full_sync = get_sync_state()
+    if full is None:
+        full = (
+            last_full_sync is None
+            or not os.path.exists("response_json.json")
+            or datetime.now(last_full_sync.tzinfo) - last_full_sync
+            > timedelta(hours=FULL_SYNC_HOURS)
         )
-        data["results"].extend(response.json().get("results", []))
-
-    with open("response_json.json", "w") as f:
-        json.dump(data, f)
-
-    # return data["results"]
-    return None
 
+    fetched: Optional[int] = None
+    if full or watermark is None:
+        full = True
+        newest = update_responses()
+        database = first_filter()
+    else:
+        changed = fetch_changes(watermark)
+        if changed:
+            merge_responses(changed)
+        database = first_filter(changed)
+        latest = _Newest()
+        for student in changed:
+            latest.see(student)
+        newest = latest.value
+        fetched = len(changed)
+
+    if newest is not None:
+        set_sync_state(newest, full=full)
+    # changed is None after a full sync, every student was checked
+    summary = {
+        "mode": "full" if full else "incremental",
+        "changed": fetched,
+        "watermark": newest or watermark,
+        "database": database,
+    }
+    print(f"beacon sync: {summary}")
+    return summary